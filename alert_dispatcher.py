@@ -0,0 +1,209 @@
+import logging
+import queue
+import random
+import threading
+import time
+
+
+def embed_length(embed):
+    """
+    Count the characters of an embed the way Discord does for its 6000 character message limit.
+
+    Args:
+        embed (dict): The embed.
+
+    Returns:
+        int: The number of counted characters.
+    """
+    length = len(str(embed.get('title') or '')) + len(str(embed.get('description') or ''))
+    for field in embed.get('fields', []):
+        length += len(str(field['name'])) + len(str(field['value']))
+
+    return length
+
+
+class AlertDispatcher:
+    def __init__(self, session_pool, max_queue=1000, batch_size=10, max_characters=6000, max_attempts=5, base_delay=1.0,
+                 timeout=10.0):
+        """
+        Initialize the dispatcher that sends Discord embeds from a background thread.
+
+        Probing workers only put embeds on a bounded queue. The dispatcher groups queued embeds per
+        webhook into messages of up to `batch_size` embeds, honours the X-RateLimit-* and Retry-After
+        headers of every webhook separately and retries failed messages with jittered backoff.
+
+        Args:
+            session_pool (SessionPool): The pool the webhook sessions are checked out from.
+            max_queue (int): The maximum number of queued alerts, new alerts are dropped beyond it.
+            batch_size (int): The maximum number of embeds per message, 10 for Discord.
+            max_characters (int): The maximum number of embed characters per message, 6000 for Discord.
+            max_attempts (int): The number of failed attempts after which a message is dropped.
+            base_delay (float): The number of seconds the retry backoff starts from.
+            timeout (float): The number of seconds a webhook request may take before it counts as failed.
+        """
+        self.session_pool = session_pool
+        self.batch_size = batch_size
+        self.max_characters = max_characters
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.timeout = timeout
+
+        self.queue = queue.Queue(maxsize=max_queue)
+        self.pending = {}  # Webhook URL -> embeds waiting to be sent
+        self.blocked_until = {}  # Webhook URL -> monotonic time the webhook may be used again
+        self.attempts = {}  # Webhook URL -> failed attempts of the message at the head of its queue
+        self.dropped = 0
+        self._stopping = threading.Event()
+        self._thread = None
+
+    def start(self):
+        """
+        Start the background dispatcher thread.
+        """
+        if self._thread is not None:
+            return
+
+        self._thread = threading.Thread(target=self._run, name='alert-dispatcher', daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=10):
+        """
+        Stop the dispatcher after the queued embeds are sent.
+
+        Args:
+            timeout (float): The maximum number of seconds to wait for the queue to drain.
+        """
+        self._stopping.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            if self._thread.is_alive():
+                pending = sum(len(embeds) for embeds in list(self.pending.values()))
+                logging.error(
+                    "Alert dispatcher did not drain within %s seconds, %s queued alert(s) and %s embed(s) were not sent",
+                    timeout, self.queue.qsize(), pending
+                )
+            self._thread = None
+
+    def submit(self, webhook_urls, embed):
+        """
+        Queue an embed for a set of webhooks without blocking.
+
+        The embed is queued once for all of its webhooks, so it is either queued for every webhook or dropped for all of them.
+
+        Args:
+            webhook_urls (list): The webhooks to send the embed to.
+            embed (dict): The embed.
+
+        Returns:
+            bool: False if the queue is full and the embed was dropped.
+        """
+        webhook_urls = list(webhook_urls)
+        try:
+            self.queue.put_nowait((webhook_urls, embed))
+        except queue.Full:
+            self.dropped += len(webhook_urls)
+            logging.error("Alert queue is full, dropped embed for %s webhook(s)", len(webhook_urls))
+            return False
+
+        return True
+
+    def _add_pending(self, webhook_urls, embed):
+        for webhook_url in webhook_urls:
+            self.pending.setdefault(webhook_url, []).append(embed)
+
+    def _next_batch(self, embeds):
+        size = 0
+        characters = 0
+        for embed in embeds[:self.batch_size]:
+            characters += embed_length(embed)
+            if size and characters > self.max_characters:
+                break
+            size += 1
+
+        return size
+
+    def _run(self):
+        while not (self._stopping.is_set() and self.queue.empty() and not self.pending):
+            now = time.monotonic()
+            ready_at = [self.blocked_until.get(url, 0) for url in self.pending]
+            timeout = min(max(0.0, min(ready_at) - now), 0.5) if ready_at else 0.5
+
+            try:
+                self._add_pending(*self.queue.get(timeout=timeout))
+                while True:
+                    self._add_pending(*self.queue.get_nowait())
+            except queue.Empty:
+                pass
+
+            now = time.monotonic()
+            for webhook_url, embeds in list(self.pending.items()):
+                if self.blocked_until.get(webhook_url, 0) > now:
+                    continue
+
+                size = self._next_batch(embeds)
+                if self._post(webhook_url, embeds[:size]):
+                    del embeds[:size]
+                    if not embeds:
+                        del self.pending[webhook_url]
+
+    def _backoff(self, webhook_url):
+        # Full jitter: a random delay up to an exponentially growing cap
+        attempts = self.attempts.get(webhook_url, 0)
+        return random.uniform(0, self.base_delay * 2 ** attempts)
+
+    def _post(self, webhook_url, embeds):
+        """
+        Send one message to a webhook.
+
+        Returns:
+            bool: True if the message is done with (sent or dropped), False if it has to be retried.
+        """
+        try:
+            with self.session_pool.session() as session:
+                response = session.post(webhook_url, json={"embeds": embeds}, timeout=self.timeout)
+        except Exception as e:
+            return self._failed(webhook_url, embeds, f"Exception occurred: {e}")
+
+        now = time.monotonic()
+        headers = response.headers
+
+        if response.status_code == 429:
+            retry_after = headers.get('Retry-After')
+            if retry_after is None:
+                try:
+                    retry_after = response.json().get('retry_after')
+                except Exception:
+                    retry_after = None
+            delay = float(retry_after) if retry_after is not None else self._backoff(webhook_url)
+            self.blocked_until[webhook_url] = now + delay + random.uniform(0, 0.1)
+            logging.warning("Discord webhook rate limited, retrying in %.2f seconds", delay)
+            return False
+
+        if response.status_code >= 500:
+            return self._failed(webhook_url, embeds, f"Discord returned status code {response.status_code}")
+
+        self.attempts.pop(webhook_url, None)
+        if headers.get('X-RateLimit-Remaining') == '0' and headers.get('X-RateLimit-Reset-After') is not None:
+            self.blocked_until[webhook_url] = now + float(headers['X-RateLimit-Reset-After'])
+
+        if response.status_code >= 400:
+            self.dropped += len(embeds)
+            logging.error("Discord rejected %s embed(s) with status code %s", len(embeds), response.status_code)
+        else:
+            logging.info("Discord message with %s embed(s) sent", len(embeds))
+
+        return True
+
+    def _failed(self, webhook_url, embeds, reason):
+        attempts = self.attempts.get(webhook_url, 0) + 1
+        if attempts >= self.max_attempts:
+            self.attempts.pop(webhook_url, None)
+            self.dropped += len(embeds)
+            logging.error("%s, dropped %s embed(s) after %s attempts", reason, len(embeds), attempts)
+            return True
+
+        self.attempts[webhook_url] = attempts
+        self.blocked_until[webhook_url] = time.monotonic() + self._backoff(webhook_url)
+        logging.warning("%s, retrying attempt %s of %s", reason, attempts + 1, self.max_attempts)
+
+        return False
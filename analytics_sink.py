@@ -0,0 +1,302 @@
+import csv
+import glob
+import json
+import logging
+import os
+import re
+import threading
+import time
+
+from profiler import stage_timers
+
+CSV_COLUMNS = [
+    ("Item ID", 'item_id'),
+    ("Price", 'price'),
+    ("Size", 'size'),
+    ("Brand", 'brand'),
+    ("User Rating", 'user_rating'),
+    ("Condition", 'condition'),
+    ("Country", 'country'),
+    ("Discovery Time", 'discovery_time'),
+    ("Current Epoch", 'current_epoch'),
+    ("Item Epoch", 'item_epoch'),
+    ("Lowest Offset", 'lowest_offset'),
+    ("Highest Offset", 'highest_offset'),
+    ("Current Offset", 'current_offset'),
+]
+
+PARQUET_COLUMNS = [
+    ('item_id', 'int64'),
+    ('price', 'string'),
+    ('size', 'string'),
+    ('brand', 'string'),
+    ('user_rating', 'string'),
+    ('condition', 'string'),
+    ('country', 'string'),
+    ('discovery_time', 'string'),
+    ('current_epoch', 'int64'),
+    ('item_epoch', 'int64'),
+    ('lowest_offset', 'int64'),
+    ('highest_offset', 'int64'),
+    ('current_offset', 'int64'),
+    ('price_amount', 'float64'),
+    ('currency_code', 'string'),
+    ('discovery_seconds', 'int64'),
+    ('brand_id', 'int64'),
+    ('size_id', 'int64'),
+    ('seller_id', 'int64'),
+    ('seller_rating', 'float64'),
+    ('seller_feedback_count', 'int64'),
+]
+
+
+def rotated_paths(path):
+    """
+    List a file together with the files it was rotated to, oldest first.
+
+    Args:
+        path (str): The path of the file.
+
+    Returns:
+        list: The paths of the rotated files in the order they were written, then `path` if it exists.
+    """
+    root, extension = os.path.splitext(path)
+    pattern = re.compile(re.escape(root) + r'\.(\d{8}-\d{6})(?:-(\d+))?' + re.escape(extension) + '$')
+
+    rotated = []
+    for candidate in glob.glob(f'{glob.escape(root)}.*{glob.escape(extension)}'):
+        match = pattern.match(candidate)
+        if match is not None:
+            rotated.append(((match.group(1), int(match.group(2) or 0)), candidate))
+
+    paths = [candidate for _, candidate in sorted(rotated)]
+    if os.path.exists(path):
+        paths.append(path)
+
+    return paths
+
+
+class RotatingFileWriter:
+    def __init__(self, path, max_bytes=5 * 1024 * 1024):
+        """
+        Initialize a writer that moves its file aside once it grows past a size.
+
+        Args:
+            path (str): The path of the file.
+            max_bytes (int): The size in bytes after which the file is rotated.
+        """
+        self.path = path
+        self.max_bytes = max_bytes
+
+    def rotate_if_needed(self):
+        """
+        Rename the file to a timestamped name when it is larger than `max_bytes`.
+
+        Returns:
+            bool: True if the file was rotated.
+        """
+        try:
+            size = os.path.getsize(self.path)
+        except OSError:
+            return False
+
+        if size < self.max_bytes:
+            return False
+
+        self.move_aside()
+
+        return True
+
+    def move_aside(self):
+        """
+        Rename the file to a timestamped name next to it, numbered when it was already rotated within the same second.
+        """
+        root, extension = os.path.splitext(self.path)
+        timestamp = time.strftime('%Y%m%d-%H%M%S')
+        rotated_path = f"{root}.{timestamp}{extension}"
+        counter = 0
+        while os.path.exists(rotated_path):
+            counter += 1
+            rotated_path = f"{root}.{timestamp}-{counter}{extension}"
+        os.replace(self.path, rotated_path)
+        logging.info("Rotated %s to %s", self.path, rotated_path)
+
+    def write(self, records):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class CsvWriter(RotatingFileWriter):
+    def __init__(self, path='sent_items.csv', columns=CSV_COLUMNS, max_bytes=5 * 1024 * 1024):
+        """
+        Initialize a writer that appends records as CSV rows.
+
+        Args:
+            path (str): The path of the CSV file.
+            columns (list): The (header, record key) pairs of the columns.
+            max_bytes (int): The size in bytes after which the file is rotated.
+        """
+        super().__init__(path, max_bytes)
+        self.columns = columns
+
+    def write(self, records):
+        self.rotate_if_needed()
+        write_headers = not os.path.exists(self.path) or os.path.getsize(self.path) == 0
+
+        with open(self.path, mode='a', newline='', encoding='utf-8') as fh:
+            writer = csv.writer(fh)
+            if write_headers:
+                writer.writerow([header for header, _ in self.columns])
+            writer.writerows([[record.get(key) for _, key in self.columns] for record in records])
+
+
+class JsonLinesWriter(RotatingFileWriter):
+    def __init__(self, path='sent_items.jsonl', max_bytes=5 * 1024 * 1024):
+        """
+        Initialize a writer that appends records as JSON Lines.
+
+        Args:
+            path (str): The path of the JSON Lines file.
+            max_bytes (int): The size in bytes after which the file is rotated.
+        """
+        super().__init__(path, max_bytes)
+
+    def write(self, records):
+        self.rotate_if_needed()
+
+        with open(self.path, mode='a', encoding='utf-8') as fh:
+            fh.writelines(json.dumps(record, ensure_ascii=False) + '\n' for record in records)
+
+
+class ParquetWriter(RotatingFileWriter):
+    def __init__(self, path='sent_items.parquet', columns=PARQUET_COLUMNS, max_bytes=5 * 1024 * 1024):
+        """
+        Initialize a writer that appends records as row groups of a Parquet file.
+
+        The schema is declared up front rather than inferred from the first batch, so a column that
+        happens to be empty in that batch still gets its type.
+
+        Args:
+            path (str): The path of the Parquet file.
+            columns (list): The (record key, pyarrow type name) pairs of the columns.
+            max_bytes (int): The size in bytes after which the file is rotated.
+        """
+        try:
+            import pyarrow
+            import pyarrow.parquet
+        except ImportError:
+            raise ImportError("The Parquet analytics format requires pyarrow, install it with 'pip install pyarrow'.")
+
+        super().__init__(path, max_bytes)
+        self.pyarrow = pyarrow
+        self.schema = pyarrow.schema([(name, getattr(pyarrow, type_name)()) for name, type_name in columns])
+        self.writer = None
+
+    def write(self, records):
+        table = self.pyarrow.Table.from_pylist(records, schema=self.schema)
+
+        if self.writer is not None and os.path.getsize(self.path) >= self.max_bytes:
+            self.close()
+
+        if self.writer is None:
+            # A closed Parquet file cannot be appended to, so an existing file is always moved aside
+            if os.path.exists(self.path):
+                self.move_aside()
+            self.writer = self.pyarrow.parquet.ParquetWriter(self.path, self.schema)
+
+        self.writer.write_table(table)
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+            self.writer = None
+
+
+class AnalyticsSink:
+    FORMATS = {'csv': CsvWriter, 'jsonl': JsonLinesWriter, 'parquet': ParquetWriter}
+
+    def __init__(self, writer, flush_size=100, flush_interval=5.0):
+        """
+        Initialize a sink that buffers records in memory and writes them in batches from a background thread.
+
+        Args:
+            writer (RotatingFileWriter): The writer the batches are written with.
+            flush_size (int): The number of buffered records that triggers a flush.
+            flush_interval (float): The maximum number of seconds a record stays buffered.
+        """
+        self.writer = writer
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+
+        self.lock = threading.Lock()
+        self.flush_lock = threading.Lock()
+        self.buffer = []
+        self._wake = threading.Event()
+        self._stopping = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='analytics-sink', daemon=True)
+        self._thread.start()
+
+    @classmethod
+    def for_format(cls, analytics_format, directory='.', **kwargs):
+        """
+        Create a sink that writes sent_items.<format> in one of the supported output formats.
+
+        Args:
+            analytics_format (str): 'csv', 'jsonl' or 'parquet'.
+            directory (str): The directory of the output file.
+            **kwargs: The flush settings passed to the sink.
+
+        Returns:
+            AnalyticsSink: The sink.
+        """
+        writer_class = cls.FORMATS[analytics_format]
+
+        return cls(writer_class(os.path.join(directory, f'sent_items.{analytics_format}')), **kwargs)
+
+    def record(self, record):
+        """
+        Buffer a record without blocking on I/O.
+
+        Args:
+            record (dict): The record.
+        """
+        with self.lock:
+            self.buffer.append(record)
+            if len(self.buffer) >= self.flush_size:
+                self._wake.set()
+
+    def flush(self):
+        """
+        Write all buffered records.
+        """
+        with self.flush_lock:
+            with self.lock:
+                records, self.buffer = self.buffer, []
+
+            if not records:
+                return
+
+            started = stage_timers.start()
+            try:
+                self.writer.write(records)
+            except Exception as e:
+                logging.error("Failed to write %s analytics records: %s", len(records), e)
+            stage_timers.stop('write', started)
+
+    def _run(self):
+        while not self._stopping.is_set():
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            self.flush()
+
+    def close(self):
+        """
+        Stop the background writer and write the remaining records.
+        """
+        self._stopping.set()
+        self._wake.set()
+        self._thread.join()
+        self.flush()
+        self.writer.close()
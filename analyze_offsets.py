@@ -0,0 +1,218 @@
+import argparse
+import csv
+import json
+import sqlite3
+import time
+
+import numpy as np
+
+from analytics_sink import rotated_paths
+
+PERCENTILES = [50, 90, 95, 99]
+
+
+def load_csv(csv_file_path='sent_items.csv'):
+    """
+    Load the offset and epoch columns of the sent items CSV file and of the files it was rotated to.
+
+    Args:
+        csv_file_path (str): The path of the sent items CSV file.
+
+    Returns:
+        dict: The 'item_id', 'current_epoch', 'item_epoch' and 'current_offset' columns as int64 arrays.
+    """
+    columns = {'Item ID': [], 'Current Epoch': [], 'Item Epoch': [], 'Current Offset': []}
+
+    for path in rotated_paths(csv_file_path) or [csv_file_path]:
+        with open(path, newline='', encoding='utf-8') as fh:
+            for row in csv.DictReader(fh):
+                try:
+                    values = [int(row[name]) for name in columns]
+                except (KeyError, TypeError, ValueError):
+                    continue
+                for name, value in zip(columns, values):
+                    columns[name].append(value)
+
+    return {
+        'item_id': np.array(columns['Item ID'], dtype=np.int64),
+        'current_epoch': np.array(columns['Current Epoch'], dtype=np.int64),
+        'item_epoch': np.array(columns['Item Epoch'], dtype=np.int64),
+        'current_offset': np.array(columns['Current Offset'], dtype=np.int64),
+    }
+
+
+def load_item_store(path='items.db'):
+    """
+    Load the offset and epoch columns of the alerted items in the item store.
+
+    Args:
+        path (str): The path of the item store database.
+
+    Returns:
+        dict: The 'item_id', 'current_epoch', 'item_epoch' and 'current_offset' columns as int64 arrays.
+    """
+    connection = sqlite3.connect(f'file:{path}?mode=ro', uri=True)
+    rows = connection.execute(
+        'SELECT item_id, discovered_at, item_epoch, current_offset FROM items '
+        'WHERE alerted = 1 AND discovered_at IS NOT NULL AND item_epoch IS NOT NULL AND current_offset IS NOT NULL '
+        'ORDER BY discovered_at'
+    ).fetchall()
+    connection.close()
+
+    data = np.array(rows, dtype=np.int64).reshape(-1, 4)
+
+    return {
+        'item_id': data[:, 0],
+        'current_epoch': data[:, 1],
+        'item_epoch': data[:, 2],
+        'current_offset': data[:, 3],
+    }
+
+
+def select_since(columns, since):
+    """
+    Keep only the rows discovered at or after an epoch.
+
+    Args:
+        columns (dict): The columns as returned by a loader.
+        since (int): The epoch of the oldest row to keep.
+
+    Returns:
+        dict: The filtered columns.
+    """
+    mask = columns['current_epoch'] >= since
+
+    return {name: values[mask] for name, values in columns.items()}
+
+
+def percentiles(values):
+    return {f'p{p}': float(v) for p, v in zip(PERCENTILES, np.percentile(values, PERCENTILES))} if len(values) else {}
+
+
+def analyze(columns, bucket_seconds=3600, id_bin=100, coverage=0.99):
+    """
+    Compute the offset, allocation rate, latency and hit density statistics of the discovered items.
+
+    Args:
+        columns (dict): The columns as returned by a loader.
+        bucket_seconds (int): The width of the time buckets of the offset distribution.
+        id_bin (int): The width in IDs of the hit density bins.
+        coverage (float): The fraction of hits the recommended probing window has to cover.
+
+    Returns:
+        dict: The report.
+    """
+    item_id = columns['item_id']
+    current_epoch = columns['current_epoch']
+    item_epoch = columns['item_epoch']
+    offset = columns['current_offset']
+
+    if len(item_id) < 2:
+        raise ValueError("At least two items are needed for an analysis.")
+
+    latency = current_epoch - item_epoch
+
+    # ID allocation rate: least squares fit of item ID against creation time
+    order = np.argsort(item_epoch, kind='stable')
+    slope, _ = np.polyfit(item_epoch[order].astype(np.float64), item_id[order].astype(np.float64), 1)
+
+    # Offsets and allocation rate per time bucket, grouped with one sort instead of a loop over masks
+    buckets = (current_epoch - current_epoch.min()) // bucket_seconds
+    order = np.argsort(buckets, kind='stable')
+    boundaries = np.flatnonzero(np.diff(buckets[order])) + 1
+    timeline = []
+    for group in np.split(order, boundaries):
+        ids, epochs = item_id[group], item_epoch[group]
+        span = epochs.max() - epochs.min()
+        timeline.append({
+            'start': int(current_epoch.min() + buckets[group[0]] * bucket_seconds),
+            'hits': int(len(group)),
+            'offset': percentiles(offset[group]),
+            'ids_per_second': float((ids.max() - ids.min()) / span) if span > 0 else None,
+        })
+
+    # Hit density per ID window of offsets
+    low, high = int(offset.min()), int(offset.max())
+    counts, edges = np.histogram(offset, bins=np.arange(low - low % id_bin, high + id_bin + 1, id_bin))
+    densest = np.argsort(counts)[::-1][:10]
+
+    # Recommended window: the narrowest offset range holding `coverage` of the hits, from the widths of
+    # every run of `size` consecutive sorted offsets
+    ordered = np.sort(offset)
+    size = min(len(ordered), max(1, int(np.ceil(coverage * len(ordered)))))
+    first = int(np.argmin(ordered[size - 1:] - ordered[:len(ordered) - size + 1]))
+    start_offset = max(0, int(ordered[first]))
+    end_offset = int(ordered[first + size - 1])
+    rates = [bucket['ids_per_second'] for bucket in timeline if bucket['ids_per_second']]
+
+    return {
+        'items': int(len(item_id)),
+        'first_discovery': int(current_epoch.min()),
+        'last_discovery': int(current_epoch.max()),
+        'ids_per_second': float(slope),
+        'ids_per_second_recent': rates[-1] if rates else None,
+        'discovery_latency': percentiles(latency),
+        'offset': percentiles(offset),
+        'offset_min': low,
+        'offset_max': high,
+        'timeline': timeline,
+        'densest_windows': [
+            {'start': int(edges[i]), 'stop': int(edges[i + 1]), 'hits': int(counts[i])} for i in densest if counts[i]
+        ],
+        'recommendation': {
+            'start_offset': start_offset,
+            'catalog_items': max(1, end_offset - start_offset),
+            'coverage': coverage,
+        },
+    }
+
+
+def print_report(report):
+    """
+    Print a report in a human readable form.
+
+    Args:
+        report (dict): The report as returned by `analyze`.
+    """
+    def fmt(stats):
+        return '  '.join(f'{name}={value:.0f}' for name, value in stats.items())
+
+    print(f"Items:              {report['items']} ({time.strftime('%Y-%m-%d %H:%M', time.gmtime(report['first_discovery']))} - "
+          f"{time.strftime('%Y-%m-%d %H:%M', time.gmtime(report['last_discovery']))} UTC)")
+    print(f"ID allocation rate: {report['ids_per_second']:.1f} IDs/s overall, "
+          f"{report['ids_per_second_recent'] or 0:.1f} IDs/s in the last bucket")
+    print(f"Discovery latency:  {fmt(report['discovery_latency'])} seconds")
+    print(f"Current offset:     {fmt(report['offset'])}  (min={report['offset_min']}, max={report['offset_max']})")
+    print("Densest ID windows:")
+    for window in report['densest_windows']:
+        print(f"  [{window['start']}, {window['stop']}): {window['hits']} hits")
+    print("Offsets over time:")
+    for bucket in report['timeline']:
+        rate = f"{bucket['ids_per_second']:.1f}" if bucket['ids_per_second'] else '-'
+        print(f"  {time.strftime('%Y-%m-%d %H:%M', time.gmtime(bucket['start']))}  hits={bucket['hits']:<5} "
+              f"ids/s={rate:<7} {fmt(bucket['offset'])}")
+
+    recommendation = report['recommendation']
+    print(f"Recommendation:     start offset {recommendation['start_offset']}, catalog_items {recommendation['catalog_items']} "
+          f"({recommendation['coverage']:.0%} of hits)")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Analyze the offsets and discovery latency of the sent items.')
+    parser.add_argument('source', nargs='?', default='sent_items.csv', help='The sent items CSV file or item store database.')
+    parser.add_argument('--since-hours', type=float, help='Only analyze the items discovered in the last N hours of the data.')
+    parser.add_argument('--bucket-seconds', type=int, default=3600, help='The width of the time buckets.')
+    parser.add_argument('--id-bin', type=int, default=100, help='The width in IDs of the hit density bins.')
+    parser.add_argument('--coverage', type=float, default=0.99, help='The fraction of hits the recommended window covers.')
+    parser.add_argument('--json', action='store_true', help='Print the report as JSON.')
+    args = parser.parse_args()
+
+    columns = load_item_store(args.source) if args.source.endswith('.db') else load_csv(args.source)
+    if args.since_hours is not None and len(columns['current_epoch']):
+        columns = select_since(columns, columns['current_epoch'].max() - int(args.since_hours * 3600))
+
+    report = analyze(columns, bucket_seconds=args.bucket_seconds, id_bin=args.id_bin, coverage=args.coverage)
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print_report(report)
@@ -0,0 +1,103 @@
+import logging
+import threading
+import time
+
+
+class CatalogPoller:
+    def __init__(self, vinted, interval=1.0):
+        """
+        Initialize the background poller of the newest catalog item.
+
+        The poller keeps fetching the catalog head on its own thread and publishes it to
+        `vinted.last_id` and the frontier estimator, so the probing engines never wait for a catalog
+        request between sweeps. A stale head makes the cookie pool refresh its cookies in the background.
+
+        Args:
+            vinted (Vinted): The Vinted instance whose catalog head is polled.
+            interval (float): The minimum number of seconds between the start of two polls.
+        """
+        self.vinted = vinted
+        self.interval = interval
+
+        self.head_id = None
+        self.head_time = None
+        self.polls = 0
+        self._updated = threading.Condition()
+        self._stopping = threading.Event()
+        self._thread = None
+
+    def start(self):
+        """
+        Start polling from a background thread.
+        """
+        if self._thread is not None:
+            return
+
+        self._stopping.clear()
+        self._thread = threading.Thread(target=self._run, name='catalog-poller', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """
+        Stop polling and wake up every thread waiting for a head.
+        """
+        self._stopping.set()
+        with self._updated:
+            self._updated.notify_all()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def poll(self):
+        """
+        Fetch the catalog head once and publish it if it moved forward.
+
+        Returns:
+            int: The published head, or None if the poll failed or returned a stale head.
+        """
+        vinted = self.vinted
+        self.polls += 1
+
+        try:
+            catalog_items = vinted.get_catalog_items()
+        except Exception as e:
+            logging.error("Exception occurred: %s", e)
+            return None
+
+        if not catalog_items:
+            return None
+
+        head_id = int(catalog_items[0]['id'])
+        if self.head_id is not None and head_id < self.head_id:
+            logging.error("Detected a lower item ID than the last ID, refreshing the session cookies.")
+            vinted.cookie_pool.refresh_all()
+            return None
+
+        now = vinted.clock()
+        with self._updated:
+            self.head_id, self.head_time = head_id, now
+            self._updated.notify_all()
+        vinted.last_id = head_id
+        vinted.frontier.observe(head_id, now)
+
+        return head_id
+
+    def _run(self):
+        while not self._stopping.is_set():
+            started = time.monotonic()
+            self.poll()
+            self._stopping.wait(max(0.0, self.interval - (time.monotonic() - started)))
+
+    def wait_for_head(self, timeout=None):
+        """
+        Wait until a catalog head has been published.
+
+        Args:
+            timeout (float): The maximum number of seconds to wait, forever when None.
+
+        Returns:
+            int: The newest catalog head, or None on timeout or when the poller stops.
+        """
+        with self._updated:
+            self._updated.wait_for(lambda: self.head_id is not None or self._stopping.is_set(), timeout)
+            return self.head_id
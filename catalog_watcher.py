@@ -0,0 +1,154 @@
+import concurrent.futures
+import hashlib
+import logging
+import threading
+import time
+from urllib.parse import urlencode
+
+from metrics import REGISTRY
+
+WATCH_POLLS = REGISTRY.counter('vinted_catalog_watch_polls_total', 'Filtered catalog polls by result.', ['watchlist', 'result'])
+WATCH_ITEMS = REGISTRY.counter(
+    'vinted_catalog_watch_items_total', 'New items of the filtered catalog by outcome, overlap when the prober had them first.',
+    ['outcome']
+)
+
+
+class CatalogWatcher:
+    def __init__(self, vinted, per_page=96, interval=2.0, workers=8):
+        """
+        Initialize the watcher of the filtered catalog, a second discovery path next to the ID prober.
+
+        Every watchlist restricts the catalog server-side with its brand, size and country IDs, so one
+        catalog request covers the newest `per_page` candidates of the watchlist. Each page is compared
+        with the previous one through its ETag and its item IDs, and only the new IDs that the prober
+        has not processed yet are fetched and run through the filter.
+
+        Args:
+            vinted (Vinted): The Vinted instance whose watchlists are polled.
+            per_page (int): The number of items requested per page.
+            interval (float): The minimum number of seconds between the start of two polls of a watchlist.
+            workers (int): The number of threads fetching the details of new items.
+        """
+        self.vinted = vinted
+        self.per_page = per_page
+        self.interval = interval
+        self.workers = workers
+
+        self.pages = {}  # Watchlist name -> ETag, digest and item IDs of the previous page
+        self._stopping = threading.Event()
+        self._thread = None
+        self._executor = None
+
+    def start(self):
+        """
+        Start polling from a background thread.
+        """
+        if self._thread is not None:
+            return
+
+        self._stopping.clear()
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='catalog-watch')
+        self._thread = threading.Thread(target=self._run, name='catalog-watcher', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """
+        Stop polling and wait for the items being fetched.
+        """
+        self._stopping.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+    def url(self, watchlist):
+        """
+        Build the catalog URL of a watchlist.
+
+        Args:
+            watchlist (Watchlist): The watchlist whose filters are applied.
+
+        Returns:
+            str: The URL of the newest items that pass the server-side filters of the watchlist.
+        """
+        query = []
+        for key in ('brand_ids', 'size_ids', 'country_ids'):
+            values = getattr(watchlist, key)
+            if values is not None:
+                query.extend((f'{key}[]', value) for value in sorted(values))
+        query.extend((('per_page', self.per_page), ('order', 'newest_first')))
+
+        return f'{self.vinted.base_url}/api/v2/catalog/items?{urlencode(query)}'
+
+    def poll(self, watchlist):
+        """
+        Fetch the catalog page of a watchlist once and process the IDs that were not on the previous page.
+
+        The first page of a watchlist only sets the baseline. When every item of a page is new, more
+        items were listed than a page holds since the previous poll, and the oldest of them are left
+        to the prober.
+
+        Args:
+            watchlist (Watchlist): The watchlist to poll.
+
+        Returns:
+            list: The new item IDs, newest first.
+        """
+        vinted = self.vinted
+        previous = self.pages.get(watchlist.name)
+        headers = {'If-None-Match': previous['etag']} if previous is not None and previous['etag'] else None
+
+        try:
+            data = vinted.request_executor.get('catalog', self.url(watchlist), headers=headers)
+            if data.status_code == 304:
+                WATCH_POLLS.inc(watchlist.name, 'unchanged')
+                return []
+            data.raise_for_status()
+            item_ids = [int(item['id']) for item in data.json().get('items', [])]
+        except Exception as e:
+            WATCH_POLLS.inc(watchlist.name, 'error')
+            logging.error("Could not poll the catalog of watchlist %s: %s", watchlist.name, e)
+            return []
+
+        digest = hashlib.sha1(repr(item_ids).encode()).digest()
+        self.pages[watchlist.name] = {'etag': data.headers.get('ETag'), 'digest': digest, 'item_ids': set(item_ids)}
+        if previous is None:
+            return []
+        if digest == previous['digest']:
+            WATCH_POLLS.inc(watchlist.name, 'unchanged')
+            return []
+
+        new_ids = [item_id for item_id in item_ids if item_id not in previous['item_ids']]
+        if item_ids and len(new_ids) == len(item_ids):
+            WATCH_POLLS.inc(watchlist.name, 'overflow')
+            logging.warning("Catalog page of watchlist %s only held new items, some may be left to the prober", watchlist.name)
+        else:
+            WATCH_POLLS.inc(watchlist.name, 'changed')
+
+        for item_id in new_ids:
+            if vinted.is_processed(item_id):
+                WATCH_ITEMS.inc('overlap')
+                continue
+
+            WATCH_ITEMS.inc('new')
+            self._executor.submit(self._process, item_id)
+
+        return new_ids
+
+    def _process(self, item_id):
+        try:
+            self.vinted.process_possible_item_id(item_id, path='catalog')
+        except Exception as e:
+            logging.error("Exception occurred: %s", e)
+
+    def _run(self):
+        while not self._stopping.is_set():
+            started = time.monotonic()
+            for watchlist in self.vinted.item_filter.watchlists:
+                if self._stopping.is_set():
+                    return
+                self.poll(watchlist)
+            self._stopping.wait(max(0.0, self.interval - (time.monotonic() - started)))
@@ -0,0 +1,277 @@
+import base64
+import json
+import logging
+import threading
+
+from metrics import REGISTRY, proxy_label
+from proxy_manager import ProxyManager
+
+COOKIE_REFRESHES = REGISTRY.counter(
+    'vinted_cookie_refreshes_total', 'Session cookies fetched by the cookie pool, by reason and outcome.', ['reason', 'outcome']
+)
+COOKIE_EVICTIONS = REGISTRY.counter(
+    'vinted_cookie_evictions_total', 'Proxies dropped from the cookie pool, by reason.', ['reason']
+)
+
+
+def token_expiry(cookies):
+    """
+    Read the expiry of the access token in a set of session cookies.
+
+    Args:
+        cookies (dict): The session cookies.
+
+    Returns:
+        float: The epoch the `access_token_web` JWT expires at, or None if there is no readable token.
+    """
+    parts = (cookies.get('access_token_web') or '').split('.')
+    if len(parts) != 3:
+        return None
+
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(parts[1] + '=' * (-len(parts[1]) % 4)))
+    except ValueError:
+        return None
+
+    expiry = payload.get('exp') if isinstance(payload, dict) else None
+    return float(expiry) if isinstance(expiry, (int, float)) else None
+
+
+class CookiePool:
+    def __init__(self, vinted, size=8, max_age=300.0, refresh_margin=60.0, interval=1.0, retry_delay=10.0,
+                 max_failures=3):
+        """
+        Initialize the pool of session cookies, each fetched through and bound to its own proxy.
+
+        Requests use the cookies of the proxy they are sent through, or the next valid cookies in
+        rotation when that proxy has none. A background thread fetches new cookies `refresh_margin`
+        seconds before they expire and right after they are rejected with a 401, so workers never
+        wait for a homepage request and no single cookie carries all the traffic. A proxy is dropped
+        from the pool when it is quarantined or after `max_failures` failed refreshes in a row, and
+        its place goes to a healthy proxy.
+
+        Args:
+            vinted (Vinted): The Vinted instance the cookies are fetched with.
+            size (int): The number of proxies that get their own cookies.
+            max_age (float): The number of seconds cookies are used for when their token has no expiry.
+            refresh_margin (float): The number of seconds before their expiry that cookies are refreshed.
+            interval (float): The number of real seconds between two checks for cookies to refresh.
+            retry_delay (float): The number of seconds before a failed refresh is retried.
+            max_failures (int): The number of failed refreshes in a row after which a proxy is dropped.
+        """
+        self.vinted = vinted
+        self.size = size
+        self.max_age = max_age
+        self.refresh_margin = refresh_margin
+        self.interval = interval
+        self.retry_delay = retry_delay
+        self.max_failures = max_failures
+
+        self.lock = threading.Lock()
+        self.entries = {}  # Proxy key -> bound cookies, their expiry and refresh state
+        self.evicted = set()  # Keys of the dropped proxies, only picked again when no other proxy is left
+        self._rotation = 0
+        self._wake = threading.Event()
+        self._stopping = threading.Event()
+        self._thread = None
+
+    def start(self):
+        """
+        Fetch the first cookies, then keep the pool filled and fresh from a background thread.
+        """
+        if self._thread is not None:
+            return
+
+        self.refresh_due()
+        self._stopping.clear()
+        self._thread = threading.Thread(target=self._run, name='cookie-pool', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """
+        Stop refreshing cookies.
+        """
+        self._stopping.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _valid(self, entry, now):
+        return not entry['rejected'] and entry['expires'] > now
+
+    def cookies(self, proxy):
+        """
+        Get the cookies to send a request through a proxy with, without blocking.
+
+        Args:
+            proxy (dict): The proxy the request is sent through.
+
+        Returns:
+            dict: The session cookies, or None if the pool holds no valid cookies yet.
+        """
+        now = self.vinted.clock()
+
+        with self.lock:
+            entry = self.entries.get(ProxyManager.proxy_key(proxy))
+            if entry is not None and self._valid(entry, now):
+                return entry['cookies']
+
+            valid = [entry for entry in self.entries.values() if self._valid(entry, now)]
+            if not valid:
+                return None
+
+            self._rotation += 1
+            return valid[self._rotation % len(valid)]['cookies']
+
+    def invalidate(self, cookies):
+        """
+        Stop using cookies that were rejected with a 401 and fetch new ones in the background.
+
+        Args:
+            cookies (dict): The cookies as returned by `cookies`.
+        """
+        if cookies is None:
+            return
+
+        with self.lock:
+            for key, entry in self.entries.items():
+                if entry['cookies'] is cookies and not entry['rejected']:
+                    entry['rejected'] = True
+                    logging.info("Session cookie of proxy %s was rejected, refreshing it", proxy_label(key))
+                    break
+            else:
+                return
+
+        self._wake.set()
+
+    def refresh_all(self):
+        """
+        Fetch new cookies for every proxy in the background, using the current ones until then.
+        """
+        now = self.vinted.clock()
+        with self.lock:
+            for entry in self.entries.values():
+                entry['refresh_at'] = min(entry['refresh_at'], now)
+                entry['reason'] = 'stale'
+
+        self._wake.set()
+
+    def valid_count(self):
+        """
+        Count the cookies that can currently be used.
+
+        Returns:
+            int: The number of valid cookies.
+        """
+        now = self.vinted.clock()
+        with self.lock:
+            return sum(self._valid(entry, now) for entry in self.entries.values())
+
+    def _due(self, now):
+        """
+        Collect the proxies whose cookies must be fetched now.
+
+        Returns:
+            list: (proxy, reason) tuples.
+        """
+        with self.vinted.proxy_manager.lock:
+            proxies = list(self.vinted.proxy_manager.proxies)
+        active = {ProxyManager.proxy_key(proxy) for proxy in proxies}
+
+        due = []
+        with self.lock:
+            for key in [key for key, entry in self.entries.items() if key not in active or entry['failures'] >= self.max_failures]:
+                entry = self.entries.pop(key)
+                self.evicted.add(key)
+                reason = 'quarantined' if key not in active else 'failing'
+                COOKIE_EVICTIONS.inc(reason)
+                logging.info("Dropped proxy %s from the cookie pool (%s, %s failed refreshes)", proxy_label(key), reason, entry['failures'])
+
+            for key, entry in self.entries.items():
+                if entry['retry_at'] > now:
+                    continue
+                if entry['rejected']:
+                    due.append((entry['proxy'], 'rejected'))
+                elif entry['refresh_at'] <= now:
+                    due.append((entry['proxy'], entry['reason']))
+
+            missing = self.size - len(self.entries)
+            if missing > 0:
+                new = [proxy for proxy in proxies if ProxyManager.proxy_key(proxy) not in self.entries]
+                new.sort(key=lambda proxy: ProxyManager.proxy_key(proxy) in self.evicted)
+                due.extend((proxy, 'new') for proxy in new[:missing])
+
+        return due
+
+    def refresh(self, proxy, reason='expiring'):
+        """
+        Fetch new cookies through a proxy and bind them to it.
+
+        A failed fetch is retried after `retry_delay` seconds, while the current cookies of the
+        proxy stay in use for as long as they are valid, until `max_failures` fetches failed in a row.
+
+        Args:
+            proxy (dict): The proxy to fetch the cookies through.
+            reason (str): Why the cookies are fetched, for the refresh counter.
+
+        Returns:
+            bool: True if new cookies were bound to the proxy.
+        """
+        key = ProxyManager.proxy_key(proxy)
+        try:
+            cookies = self.vinted.get_session_cookie(proxy)
+        except Exception as e:
+            COOKIE_REFRESHES.inc(reason, 'error')
+            logging.error("Could not refresh the session cookie of proxy %s: %s", proxy_label(key), e)
+            now = self.vinted.clock()
+            with self.lock:
+                entry = self.entries.setdefault(key, {
+                    'proxy': proxy, 'cookies': None, 'fetched': None, 'expires': 0.0, 'refresh_at': 0.0, 'reason': reason,
+                    'rejected': False, 'failures': 0,
+                })
+                entry['retry_at'] = now + self.retry_delay
+                entry['failures'] += 1
+            return False
+
+        now = self.vinted.clock()
+        expires = now + self.max_age
+        token_expires = token_expiry(cookies)
+        if token_expires is not None:
+            expires = min(expires, token_expires)
+
+        with self.lock:
+            self.entries[key] = {
+                'proxy': proxy,
+                'cookies': cookies,
+                'fetched': now,
+                'expires': expires,
+                'refresh_at': max(now, expires - self.refresh_margin),
+                'reason': 'expiring',
+                'rejected': False,
+                'retry_at': 0.0,
+                'failures': 0,
+            }
+            self.evicted.discard(key)
+        COOKIE_REFRESHES.inc(reason, 'ok')
+
+        return True
+
+    def refresh_due(self):
+        """
+        Fetch the cookies that are missing, expiring or rejected.
+        """
+        for proxy, reason in self._due(self.vinted.clock()):
+            if self._stopping.is_set():
+                return
+            self.refresh(proxy, reason)
+
+    def _run(self):
+        while not self._stopping.is_set():
+            try:
+                self.refresh_due()
+            except Exception as e:
+                logging.error("Cookie pool refresh failed: %s", e)
+
+            self._wake.wait(self.interval)
+            self._wake.clear()
@@ -0,0 +1,198 @@
+import threading
+import time
+
+
+class FrontierEstimator:
+    def __init__(self, min_window=200, max_window=5000, backfill=50, growth=2.0, smoothing=0.2, min_interval=1.0, hot_seconds=3.0,
+                 clock=time.time):
+        """
+        Initialize the frontier estimator.
+
+        The frontier is the highest item ID that exists on Vinted. The estimator learns how fast
+        IDs are allocated from the catalog head and from found items, and predicts a narrow window
+        of IDs around the frontier to probe instead of a blind sweep ahead of the catalog head.
+
+        Args:
+            min_window (int): The smallest number of IDs in a probing window.
+            max_window (int): The largest number of IDs in a probing window.
+            backfill (int): The number of IDs below the highest found ID that are probed again.
+            growth (float): The factor the window grows by after a sweep that missed the frontier.
+            smoothing (float): The EWMA weight of a new allocation rate sample.
+            min_interval (float): The minimum number of seconds between two rate samples.
+            hot_seconds (float): The number of seconds of allocations on either side of the predicted frontier that are hot.
+            clock (callable): The function returning the current epoch.
+        """
+        self.min_window = min_window
+        self.max_window = max_window
+        self.backfill = backfill
+        self.growth = growth
+        self.smoothing = smoothing
+        self.min_interval = min_interval
+        self.hot_seconds = hot_seconds
+        self.clock = clock
+        self.lock = threading.Lock()
+
+        self.rate = None  # IDs per second
+        self.lead = min_window  # IDs probed past the predicted frontier
+        self.lookback = 0  # IDs probed below the window base after empty sweeps
+
+        self.highest_id = None
+        self.highest_time = None
+        self._anchor_id = None
+        self._anchor_time = None
+        self._sweep = None
+
+    def observe(self, item_id, timestamp=None):
+        """
+        Record an item ID that is known to exist, either the catalog head or a found item.
+
+        Args:
+            item_id (int): The ID of the existing item.
+            timestamp (float): The epoch at which the item was seen, defaults to now.
+        """
+        item_id = int(item_id)
+        if timestamp is None:
+            timestamp = self.clock()
+
+        with self.lock:
+            if self.highest_id is None or item_id > self.highest_id:
+                self.highest_id, self.highest_time = item_id, timestamp
+
+            if self._anchor_id is None:
+                self._anchor_id, self._anchor_time = item_id, timestamp
+            elif self.highest_id > self._anchor_id and self.highest_time - self._anchor_time >= self.min_interval:
+                rate = (self.highest_id - self._anchor_id) / (self.highest_time - self._anchor_time)
+                self.rate = rate if self.rate is None else self.rate + self.smoothing * (rate - self.rate)
+                self._anchor_id, self._anchor_time = self.highest_id, self.highest_time
+
+            sweep = self._sweep
+            if sweep is not None and sweep['start'] <= item_id < sweep['stop']:
+                sweep['found'] += 1
+                if sweep['highest'] is None or item_id > sweep['highest']:
+                    sweep['highest'] = item_id
+
+    def snapshot(self):
+        """
+        Get the learned state of the estimator.
+
+        Returns:
+            dict: The JSON serializable state, to be passed to `restore`.
+        """
+        with self.lock:
+            return {
+                'rate': self.rate,
+                'lead': self.lead,
+                'lookback': self.lookback,
+                'highest_id': self.highest_id,
+                'highest_time': self.highest_time,
+            }
+
+    def restore(self, snapshot):
+        """
+        Restore the learned state of the estimator.
+
+        Args:
+            snapshot (dict): The state as returned by `snapshot`.
+        """
+        with self.lock:
+            self.rate = snapshot.get('rate')
+            self.lead = snapshot.get('lead', self.lead)
+            self.lookback = snapshot.get('lookback', self.lookback)
+            self.highest_id = snapshot.get('highest_id')
+            self.highest_time = snapshot.get('highest_time')
+            self._anchor_id, self._anchor_time = self.highest_id, self.highest_time
+
+    def predict(self, now=None):
+        """
+        Predict the current frontier from the highest known ID and the allocation rate.
+
+        Args:
+            now (float): The epoch to predict the frontier for, defaults to now.
+
+        Returns:
+            int: The predicted frontier, or None if no ID has been observed yet.
+        """
+        if self.highest_id is None:
+            return None
+
+        if self.rate is None:
+            return self.highest_id
+
+        if now is None:
+            now = self.clock()
+
+        return self.highest_id + int(self.rate * max(0.0, now - self.highest_time))
+
+    def is_hot(self, item_id, now=None):
+        """
+        Check whether an ID lies in the hot zone around the predicted frontier, where new items appear.
+
+        The zone spans `hot_seconds` of allocations on either side of the prediction, and at least
+        `backfill` IDs.
+
+        Args:
+            item_id (int): The ID to check.
+            now (float): The epoch to predict the frontier for, defaults to now.
+
+        Returns:
+            bool: True if the ID is in the hot zone.
+        """
+        predicted = self.predict(now)
+        if predicted is None:
+            return False
+
+        margin = self.backfill if self.rate is None else max(self.backfill, int(self.rate * self.hot_seconds))
+        return predicted - margin <= item_id <= predicted + margin
+
+    def begin_sweep(self, last_id, now=None):
+        """
+        Start a sweep and return the window of IDs to probe.
+
+        Args:
+            last_id (int): The ID of the newest item in the catalog.
+            now (float): The epoch of the sweep, defaults to now.
+
+        Returns:
+            range: The item IDs to probe, in probing order.
+        """
+        last_id = int(last_id)
+
+        with self.lock:
+            predicted = self.predict(now)
+            if predicted is None:
+                base = frontier = last_id
+            else:
+                base = max(last_id, self.highest_id - self.backfill)
+                frontier = max(predicted, base)
+
+            start = max(last_id, base - self.lookback)
+            stop = frontier + self.lead
+            stop = min(max(stop, start + self.min_window), start + self.max_window)
+
+            self._sweep = {'start': start, 'stop': stop, 'frontier': frontier, 'found': 0, 'highest': None}
+
+        return range(start, stop)
+
+    def end_sweep(self):
+        """
+        Finish the current sweep and widen, shift or narrow the next window based on its hits.
+        """
+        with self.lock:
+            sweep = self._sweep
+            self._sweep = None
+            if sweep is None:
+                return
+
+            if sweep['found'] == 0:
+                # Nothing exists in the window, search wider in both directions
+                self.lead = min(self.max_window, int(self.lead * self.growth))
+                self.lookback = min(self.max_window, max(self.min_window, int(self.lookback * self.growth)))
+            elif sweep['highest'] >= sweep['stop'] - self.backfill:
+                # Hits up to the top edge, the frontier lies beyond the window
+                self.lead = min(self.max_window, int(self.lead * self.growth))
+                self.lookback = 0
+            else:
+                # The frontier was inside the window, bisect the lead towards what was needed
+                needed = sweep['highest'] - sweep['frontier'] + self.backfill
+                self.lead = max(self.min_window, (self.lead + needed) // 2)
+                self.lookback //= 2
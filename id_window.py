@@ -0,0 +1,118 @@
+import threading
+
+from types import SimpleNamespace
+
+
+class IdWindow:
+    def __init__(self, size=1 << 22, bits=None, base=None, lock=None):
+        """
+        Initialize a bitmap that remembers item IDs over a sliding window behind the highest added ID.
+
+        The bitmap is a ring buffer indexed by `item_id % size`, so memory stays at `size / 8` bytes
+        however long the process runs. IDs that fall more than `size` behind the highest added ID are
+        dropped and reported as seen, since the scanner never goes back that far.
+
+        Args:
+            size (int): The number of IDs in the window, a multiple of 8.
+            bits (bytearray): The buffer holding the bitmap, a shared array to share the window across processes.
+            base (object): An object whose `value` holds the lowest ID in the window.
+            lock (Lock): The lock guarding the bitmap, a process lock to share the window across processes.
+        """
+        if size % 8:
+            raise ValueError("Window size must be a multiple of 8.")
+
+        self.size = size
+        self.bits = bits if bits is not None else bytearray(size // 8)
+        self.base = base if base is not None else SimpleNamespace(value=0)
+        self.lock = lock if lock is not None else threading.Lock()
+
+    @classmethod
+    def shared(cls, size=1 << 22, context=None):
+        """
+        Create a window in shared memory that can be passed to worker processes.
+
+        Args:
+            size (int): The number of IDs in the window, a multiple of 8.
+            context (BaseContext): The multiprocessing context the worker processes are started with.
+
+        Returns:
+            IdWindow: The shared window.
+        """
+        if context is None:
+            import multiprocessing
+            context = multiprocessing.get_context()
+
+        return cls(size, bits=context.RawArray('B', size // 8), base=context.RawValue('q', 0), lock=context.Lock())
+
+    def __contains__(self, item_id):
+        item_id = int(item_id)
+        base = self.base.value
+
+        if item_id < base:
+            return True
+
+        if item_id >= base + self.size:
+            return False
+
+        index = item_id % self.size
+        return bool(self.bits[index >> 3] & (1 << (index & 7)))
+
+    def _advance(self, item_id):
+        # Slide the window so it ends at item_id, clearing the slots of the IDs that drop out
+        old_base = self.base.value
+        new_base = item_id - self.size + 1
+
+        if new_base - old_base >= self.size:
+            self.bits[:] = bytes(len(self.bits))
+        else:
+            start = old_base % self.size
+            stop = start + new_base - old_base
+            if stop <= self.size:
+                self._clear(start, stop)
+            else:
+                self._clear(start, self.size)
+                self._clear(0, stop - self.size)
+
+        self.base.value = new_base
+
+    def _clear(self, start, stop):
+        # Clear the bits [start, stop) with whole-byte slices for everything but the edges
+        while start < stop and start & 7:
+            self.bits[start >> 3] &= ~(1 << (start & 7)) & 0xFF
+            start += 1
+
+        full_stop = stop & ~7
+        if start < full_stop:
+            self.bits[start >> 3:full_stop >> 3] = bytes((full_stop - start) >> 3)
+            start = full_stop
+
+        while start < stop:
+            self.bits[start >> 3] &= ~(1 << (start & 7)) & 0xFF
+            start += 1
+
+    def add(self, item_id):
+        """
+        Add an item ID to the window.
+
+        Args:
+            item_id (int): The ID to add.
+
+        Returns:
+            bool: True if the ID was not in the window yet, False otherwise.
+        """
+        item_id = int(item_id)
+
+        with self.lock:
+            if item_id < self.base.value:
+                return False
+
+            if item_id >= self.base.value + self.size:
+                self._advance(item_id)
+
+            index = item_id % self.size
+            mask = 1 << (index & 7)
+            if self.bits[index >> 3] & mask:
+                return False
+
+            self.bits[index >> 3] |= mask
+            return True
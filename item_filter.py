@@ -0,0 +1,232 @@
+import time
+
+from datetime import datetime
+
+
+def parse_epoch(timestamp):
+    """
+    Convert an ISO 8601 timestamp from the Vinted API to an epoch.
+
+    Args:
+        timestamp (str): The timestamp, for example '2024-07-22T00:40:02+01:00'.
+
+    Returns:
+        int: The number of seconds since the epoch.
+    """
+    # An aware datetime converts to an epoch directly, no timezone round trip needed
+    return int(datetime.fromisoformat(timestamp).timestamp())
+
+
+class Watchlist:
+    def __init__(self, name, brand_ids=None, size_ids=None, country_ids=None, price_min=None, price_max=None,
+                 conditions=None, min_rating=None, webhook_urls=None):
+        """
+        Initialize a named set of rules an item has to pass to be alerted.
+
+        Rules that are None accept every item.
+
+        Args:
+            name (str): The name of the watchlist.
+            brand_ids (list): The accepted brand IDs.
+            size_ids (list): The accepted size IDs.
+            country_ids (list): The accepted country IDs.
+            price_min (float): The minimum price.
+            price_max (float): The maximum price.
+            conditions (list): The accepted conditions, for example 'Very good'.
+            min_rating (float): The minimum seller rating, in stars from 0 to 5.
+            webhook_urls (list): The Discord webhooks of this watchlist, the default webhooks when None.
+        """
+        self.name = name
+        self.brand_ids = frozenset(brand_ids) if brand_ids is not None else None
+        self.size_ids = frozenset(size_ids) if size_ids is not None else None
+        self.country_ids = frozenset(country_ids) if country_ids is not None else None
+        self.price_min = price_min
+        self.price_max = price_max
+        self.conditions = frozenset(conditions) if conditions is not None else None
+        self.min_rating = min_rating
+        self.webhook_urls = webhook_urls
+
+    @property
+    def has_extra_rules(self):
+        return self.price_min is not None or self.price_max is not None or self.conditions is not None or self.min_rating is not None
+
+    def accepts_extra(self, item):
+        """
+        Check the rules that are not indexed by the filter.
+
+        Args:
+            item (dict): The item details.
+
+        Returns:
+            bool: True if the item passes the price, condition and rating rules.
+        """
+        if self.price_min is not None or self.price_max is not None:
+            price = float(item['price']['amount'])
+            if self.price_min is not None and price < self.price_min:
+                return False
+            if self.price_max is not None and price > self.price_max:
+                return False
+
+        if self.conditions is not None and item.get('status') not in self.conditions:
+            return False
+
+        if self.min_rating is not None and (item['user'].get('feedback_reputation') or 0) * 5 < self.min_rating:
+            return False
+
+        return True
+
+
+class ItemMatch:
+    def __init__(self, item, epoch, watchlists):
+        """
+        Initialize the result of an item that passed the filter.
+
+        Args:
+            item (dict): The item details.
+            epoch (int): The epoch the item was last updated at.
+            watchlists (list): The watchlists the item matched.
+        """
+        self.item = item
+        self.epoch = epoch
+        self.watchlists = watchlists
+
+    def webhook_urls(self, default_webhook_urls):
+        """
+        Get the webhooks the item has to be sent to.
+
+        Args:
+            default_webhook_urls (list): The webhooks of watchlists without webhooks of their own.
+
+        Returns:
+            list: The unique webhook URLs, in watchlist order.
+        """
+        urls = []
+        for watchlist in self.watchlists:
+            for url in watchlist.webhook_urls if watchlist.webhook_urls is not None else default_webhook_urls:
+                if url not in urls:
+                    urls.append(url)
+
+        return urls
+
+
+class ItemFilter:
+    DIMENSIONS = (('country_id', 'country_ids'), ('size_id', 'size_ids'), ('brand_id', 'brand_ids'))
+
+    def __init__(self, settings, maximum_delay=15):
+        """
+        Compile the settings into a filter that evaluates all watchlists in a single pass.
+
+        Each watchlist gets a bit. For every indexed field a dict maps a value to the bits of the
+        watchlists that accept it, so checking an item is three dict lookups and two ANDs however
+        many watchlists there are. Only the watchlists that survive are checked for their other rules.
+
+        Args:
+            settings (dict): The settings, with top level 'brand_ids', 'size_ids' and 'country_ids'
+                for the default watchlist and/or a 'watchlists' list of named watchlists.
+            maximum_delay (int): The maximum age of an item in seconds.
+        """
+        self.maximum_delay = maximum_delay
+        self.watchlists = []
+
+        if any(key in settings for _, key in self.DIMENSIONS):
+            self.watchlists.append(Watchlist('default', **{key: settings.get(key) for _, key in self.DIMENSIONS}))
+
+        for watchlist in settings.get('watchlists', []):
+            self.watchlists.append(Watchlist(**watchlist))
+
+        self.all_mask = (1 << len(self.watchlists)) - 1
+        self.extra_mask = 0
+        self.dimensions = []
+
+        for field, key in self.DIMENSIONS:
+            index = {}
+            any_mask = 0
+            for bit, watchlist in enumerate(self.watchlists):
+                values = getattr(watchlist, key)
+                if values is None:
+                    any_mask |= 1 << bit
+                else:
+                    for value in values:
+                        index[value] = index.get(value, 0) | 1 << bit
+            self.dimensions.append((field, index, any_mask))
+
+        for bit, watchlist in enumerate(self.watchlists):
+            if watchlist.has_extra_rules:
+                self.extra_mask |= 1 << bit
+
+        # Raw JSON key -> (index, any mask) for the fields at least one watchlist restricts, most selective first
+        dimensions = {field: (index, any_mask) for field, index, any_mask in self.dimensions if any_mask != self.all_mask}
+        self.raw_dimensions = [
+            (f'"{field}":'.encode(), *dimensions[field]) for field in ('brand_id', 'size_id', 'country_id') if field in dimensions
+        ]
+
+    def match(self, item, now=None):
+        """
+        Run an item through every watchlist.
+
+        Args:
+            item (dict): The item details.
+            now (float): The current epoch, defaults to now.
+
+        Returns:
+            ItemMatch: The match, or None if the item passed no watchlist or is too old.
+        """
+        mask = self.all_mask
+        for field, index, any_mask in self.dimensions:
+            mask &= index.get(item.get(field), 0) | any_mask
+            if not mask:
+                return None
+
+        epoch = parse_epoch(item['updated_at_ts'])
+        if (now if now is not None else time.time()) - epoch > self.maximum_delay:
+            return None
+
+        watchlists = []
+        while mask:
+            bit = mask & -mask
+            mask ^= bit
+            watchlist = self.watchlists[bit.bit_length() - 1]
+            if not bit & self.extra_mask or watchlist.accepts_extra(item):
+                watchlists.append(watchlist)
+
+        if not watchlists:
+            return None
+
+        return ItemMatch(item, epoch, watchlists)
+
+    def prefilter(self, raw):
+        """
+        Reject an item from its raw JSON body, before it is decoded.
+
+        Every occurrence of an indexed field in the body is scanned with `bytes.find`, including ones
+        in nested objects. The item is only rejected when no occurrence of a field has a value any
+        watchlist accepts, so the prefilter never rejects an item that `match` would accept.
+
+        Args:
+            raw (bytes): The raw JSON body of the item details response.
+
+        Returns:
+            bool: False if the item cannot match any watchlist, True if it has to be decoded and matched.
+        """
+        mask = self.all_mask
+        length = len(raw)
+        for key, index, any_mask in self.raw_dimensions:
+            position = raw.find(key)
+            if position == -1:
+                # The field is missing from the body, leave the decision to the full match
+                continue
+
+            field_mask = any_mask
+            while position != -1:
+                start = end = position + len(key)
+                while end < length and 48 <= raw[end] <= 57:  # ASCII digits
+                    end += 1
+                if end > start:
+                    field_mask |= index.get(int(raw[start:end]), 0)
+                position = raw.find(key, end)
+
+            mask &= field_mask
+            if not mask:
+                return False
+
+        return True
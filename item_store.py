@@ -0,0 +1,241 @@
+import argparse
+import csv
+import logging
+import re
+import sqlite3
+import threading
+
+from analytics_sink import rotated_paths
+
+COLUMNS = [
+    'item_id', 'price_amount', 'currency_code', 'brand', 'brand_id', 'size', 'size_id', 'condition', 'seller_id',
+    'seller_rating', 'seller_feedback_count', 'country', 'item_epoch', 'discovered_at', 'discovery_seconds',
+    'lowest_offset', 'highest_offset', 'current_offset', 'alerted',
+]
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS items (
+    item_id INTEGER PRIMARY KEY,
+    price_amount REAL,
+    currency_code TEXT,
+    brand TEXT,
+    brand_id INTEGER,
+    size TEXT,
+    size_id INTEGER,
+    condition TEXT,
+    seller_id INTEGER,
+    seller_rating REAL,
+    seller_feedback_count INTEGER,
+    country TEXT,
+    item_epoch INTEGER,
+    discovered_at INTEGER,
+    discovery_seconds INTEGER,
+    lowest_offset INTEGER,
+    highest_offset INTEGER,
+    current_offset INTEGER,
+    alerted INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS idx_items_brand ON items (brand);
+CREATE INDEX IF NOT EXISTS idx_items_discovered_at ON items (discovered_at);
+'''
+
+RATING_PATTERN = re.compile(r'\((\d+)\)\s*$')
+
+
+def parse_price(value):
+    """
+    Split a price label such as '25.0 GBP' into its amount and currency.
+
+    Args:
+        value (str): The price label.
+
+    Returns:
+        tuple: The amount as a float and the currency code, None for parts that cannot be parsed.
+    """
+    amount, _, currency_code = (value or '').strip().rpartition(' ')
+    try:
+        return float(amount), currency_code or None
+    except ValueError:
+        return None, None
+
+
+def parse_seconds(value):
+    """
+    Parse a duration label such as '3 seconds'.
+
+    Args:
+        value (str): The duration label.
+
+    Returns:
+        int: The number of seconds, or None if it cannot be parsed.
+    """
+    try:
+        return int((value or '').split()[0])
+    except (IndexError, ValueError):
+        return None
+
+
+def parse_rating(value):
+    """
+    Parse a rating label such as '⭐️⭐️⭐️⭐️☆ (2)'.
+
+    Args:
+        value (str): The rating label.
+
+    Returns:
+        tuple: The number of stars and the number of reviews, None for parts that cannot be parsed.
+    """
+    value = value or ''
+    found = RATING_PATTERN.search(value)
+
+    return float(value.count('⭐')), int(found.group(1)) if found else None
+
+
+def parse_int(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+class ItemStore:
+    def __init__(self, path='items.db'):
+        """
+        Initialize the SQLite store of discovered items and their timing metrics.
+
+        The store is written in batches through an AnalyticsSink and runs in WAL mode, so analysis
+        queries can read it while the scanner writes.
+
+        Args:
+            path (str): The path of the SQLite database.
+        """
+        self.path = path
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute('PRAGMA synchronous=NORMAL')
+        self.connection.executescript(SCHEMA)
+
+    @staticmethod
+    def to_row(record):
+        """
+        Convert an analytics record to an items row.
+
+        Args:
+            record (dict): The analytics record.
+
+        Returns:
+            tuple: The values of the row, in column order.
+        """
+        row = dict(record)
+        row.setdefault('discovered_at', record.get('current_epoch'))
+        row['alerted'] = int(record.get('alerted', True))
+
+        return tuple(row.get(column) for column in COLUMNS)
+
+    def write(self, records):
+        """
+        Insert a batch of records in a single transaction. Alerted items replace earlier probed hits.
+
+        Args:
+            records (list): The analytics records.
+        """
+        rows = [self.to_row(record) for record in records]
+
+        with self.lock:
+            self.connection.execute('BEGIN')
+            self.connection.executemany(
+                f"INSERT INTO items ({', '.join(COLUMNS)}) VALUES ({', '.join('?' * len(COLUMNS))}) "
+                f"ON CONFLICT (item_id) DO UPDATE SET {', '.join(f'{column} = excluded.{column}' for column in COLUMNS[1:])} "
+                f"WHERE excluded.alerted >= items.alerted",
+                rows
+            )
+            self.connection.execute('COMMIT')
+
+    def import_csv(self, csv_file_path='sent_items.csv', batch_size=1000):
+        """
+        Import the rows of the sent items CSV file and of the files it was rotated to.
+
+        Args:
+            csv_file_path (str): The path of the sent items CSV file.
+            batch_size (int): The number of rows per transaction.
+
+        Returns:
+            int: The number of imported rows.
+        """
+        count = 0
+        batch = []
+
+        for path in rotated_paths(csv_file_path) or [csv_file_path]:
+            with open(path, newline='', encoding='utf-8') as fh:
+                for row in csv.DictReader(fh):
+                    item_id = parse_int(row.get('Item ID'))
+                    if item_id is None:
+                        continue
+
+                    price_amount, currency_code = parse_price(row.get('Price'))
+                    seller_rating, seller_feedback_count = parse_rating(row.get('User Rating'))
+                    batch.append({
+                        'item_id': item_id,
+                        'price_amount': price_amount,
+                        'currency_code': currency_code,
+                        'brand': row.get('Brand'),
+                        'size': row.get('Size'),
+                        'condition': row.get('Condition'),
+                        'seller_rating': seller_rating,
+                        'seller_feedback_count': seller_feedback_count,
+                        'country': row.get('Country'),
+                        'item_epoch': parse_int(row.get('Item Epoch')),
+                        'current_epoch': parse_int(row.get('Current Epoch')),
+                        'discovery_seconds': parse_seconds(row.get('Discovery Time')),
+                        'lowest_offset': parse_int(row.get('Lowest Offset')),
+                        'highest_offset': parse_int(row.get('Highest Offset')),
+                        'current_offset': parse_int(row.get('Current Offset')),
+                    })
+
+                    if len(batch) >= batch_size:
+                        self.write(batch)
+                        count += len(batch)
+                        batch = []
+
+        if batch:
+            self.write(batch)
+            count += len(batch)
+
+        logging.info("Imported %s items from %s", count, csv_file_path)
+
+        return count
+
+    def query(self, sql, parameters=()):
+        """
+        Run a read query against the store.
+
+        Args:
+            sql (str): The SQL query.
+            parameters (tuple): The query parameters.
+
+        Returns:
+            list: The result rows.
+        """
+        with self.lock:
+            return self.connection.execute(sql, parameters).fetchall()
+
+    def close(self):
+        """
+        Close the database connection.
+        """
+        with self.lock:
+            self.connection.close()
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO, format='[%(asctime)s] - %(message)s', datefmt='%d-%m-%y %H:%M:%S')
+
+    parser = argparse.ArgumentParser(description='Import the sent items CSV file into the item store.')
+    parser.add_argument('csv_file_path', nargs='?', default='sent_items.csv', help='The sent items CSV file.')
+    parser.add_argument('--database', default='items.db', help='The item store database.')
+    args = parser.parse_args()
+
+    store = ItemStore(args.database)
+    store.import_csv(args.csv_file_path)
+    store.close()
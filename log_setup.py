@@ -0,0 +1,120 @@
+import atexit
+import itertools
+import json
+import logging
+import logging.handlers
+import queue
+import sys
+
+TEXT_FORMAT = '[%(asctime)s] - %(message)s'
+DATE_FORMAT = '%d-%m-%y %H:%M:%S'
+
+# Attributes every LogRecord has, everything else was passed with `extra`
+RECORD_ATTRIBUTES = frozenset(vars(logging.LogRecord('', 0, '', 0, '', None, None))) | {'message', 'asctime'}
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        """
+        Format a record as one JSON object per line.
+
+        The fields of a record logged with a dict argument (`logging.info('%(item_id)s', fields)`) and
+        the fields passed with `extra` are written as top level keys next to the message.
+
+        Args:
+            record (LogRecord): The record.
+
+        Returns:
+            str: The JSON line.
+        """
+        entry = {
+            'time': record.created,
+            'level': record.levelname,
+            'message': record.getMessage(),
+        }
+        if isinstance(record.args, dict):
+            entry.update(record.args)
+        for key, value in vars(record).items():
+            if key not in RECORD_ATTRIBUTES:
+                entry[key] = value
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class DeferredQueueHandler(logging.handlers.QueueHandler):
+    def prepare(self, record):
+        # Leave the formatting to the listener thread, the records never leave the process and the
+        # arguments logged on the hot path are immutable numbers and strings
+        return record
+
+
+class ProbeSampler:
+    def __init__(self, every=100):
+        """
+        Initialize the sampler of the per-probe log lines.
+
+        Args:
+            every (int): Log one probe in `every`, 0 to log none and 1 to log all of them.
+        """
+        self.every = every
+        self._counter = itertools.count()
+
+    def __call__(self):
+        """
+        Decide whether to log the current probe. Check this before building the log arguments.
+
+        Returns:
+            bool: True for one probe in `every`.
+        """
+        return self.every > 0 and next(self._counter) % self.every == 0
+
+
+sample_probe = ProbeSampler()
+_listener = None
+
+
+def configure_logging(level=logging.DEBUG, json_output=False, probe_sample=100, stream=None):
+    """
+    Send all log records through a queue to a background writer thread.
+
+    Threads only put records on an unbounded queue, so the handler lock and the write to stderr are
+    taken by the writer thread alone and never serialize the probing workers. Records are formatted
+    in the writer thread too. Calling this again replaces the previous configuration.
+
+    Args:
+        level (int): The level of the root logger.
+        json_output (bool): Write one JSON object per line instead of text lines.
+        probe_sample (int): Log one probe in `probe_sample`, 0 to log none. Errors and hits are always logged.
+        stream (file): The stream to write to, stderr when None.
+    """
+    global _listener
+
+    if _listener is not None:
+        _listener.stop()
+
+    handler = logging.StreamHandler(stream if stream is not None else sys.stderr)
+    handler.setFormatter(JsonFormatter() if json_output else logging.Formatter(TEXT_FORMAT, DATE_FORMAT))
+
+    records = queue.SimpleQueue()
+    _listener = logging.handlers.QueueListener(records, handler)
+    _listener.start()
+
+    root = logging.getLogger()
+    for previous in list(root.handlers):
+        root.removeHandler(previous)
+    root.addHandler(DeferredQueueHandler(records))
+    root.setLevel(level)
+
+    sample_probe.every = probe_sample
+
+
+@atexit.register
+def _flush():
+    # Write the queued records before the interpreter exits
+    global _listener
+
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
@@ -1,31 +1,81 @@
+import argparse
+import asyncio
 import json
 import logging
+import os
 import threading
 import concurrent.futures
 import time
-import csv
-import os
-
-from retrying import retry
-from curl_cffi import requests
-from datetime import datetime, timezone
-from proxy_manager import ProxyManager
 
-logging.basicConfig(level=logging.DEBUG, format='[%(asctime)s] - %(message)s', datefmt='%d-%m-%y %H:%M:%S')
+try:
+    import orjson
+except ImportError:  # Fall back to the standard library parser
+    orjson = None
 
-# TODO: Add a rate limiter to prevent getting rate limited by Vinted (analyze the rate limit and implement rate limiter)
-# TODO: Add multi-processing (multiple process instances) in order to properly scale this application on all CPU cores
-# TODO: Profile the application to find bottlenecks and optimize the code
-# TODO: Add a database to store the items and their details (nice to have)
+from proxy_manager import ProxyManager
+from probe_engine import AsyncProbeEngine
+from frontier import FrontierEstimator
+from rate_limiter import ProxyRateLimiter
+from session_pool import SessionPool
+from id_window import IdWindow
+from state_store import StateStore
+from item_filter import ItemFilter, parse_epoch
+from alert_dispatcher import AlertDispatcher
+from analytics_sink import AnalyticsSink
+from item_store import ItemStore
+from metrics import REGISTRY, DISCOVERY_BUCKETS, proxy_label, start_metrics_server
+from log_setup import configure_logging, sample_probe
+from profiler import install_signal_handler, stage_timers, start_capture
+from catalog_poller import CatalogPoller
+from catalog_watcher import CatalogWatcher
+from cookie_pool import CookiePool
+from request_executor import RequestExecutor
+from reprobe_scheduler import ReprobeScheduler
+
+configure_logging()
+
+API_HEADERS = {
+    'Cache-Control': 'no-cache',
+    'Referer': 'https://vinted.co.uk/',
+    'Origin': 'https://www.vinted.co.uk/catalog',
+    'Platform': 'Windows',
+    'Accept-Language': 'en-GB',
+    'Content-Type': "application/json",
+}
+
+PROBES = REGISTRY.counter('vinted_probes_total', 'Item detail requests by status code.', ['status'])
+ITEMS = REGISTRY.counter('vinted_items_total', 'Found items by filter outcome.', ['outcome'])
+PROXY_LATENCY = REGISTRY.histogram('vinted_proxy_latency_seconds', 'Latency of the requests sent through each proxy.', ['proxy'])
+DISCOVERY_LATENCY = REGISTRY.histogram(
+    'vinted_discovery_latency_seconds', 'Seconds between the update of an alerted item and its discovery, by discovery path.',
+    ['path'], buckets=DISCOVERY_BUCKETS
+)
+DISCOVERIES = REGISTRY.counter('vinted_discoveries_total', 'Alerted items by the path that discovered them, probe or catalog.', ['path'])
+WORKERS = REGISTRY.gauge('vinted_workers', 'Current number of probing workers or in-flight requests.')
+QUEUE_DEPTH = REGISTRY.gauge('vinted_queue_depth', 'Number of alerts and records waiting to be sent or written.', ['queue'])
+ID_RATE = REGISTRY.gauge('vinted_id_rate', 'Estimated number of item IDs allocated per second.')
+SESSIONS = REGISTRY.gauge('vinted_sessions', 'Number of valid session cookies in the cookie pool.')
 
 
 class Vinted:
-    def __init__(self):
+    def __init__(self, proxies=None, sent_item_ids=None, base_url='https://www.vinted.co.uk', data_dir='.', session_pool=None,
+                 clock=time.time, checked_item_ids=None):
         """
         Initialize the Vinted class with default settings and configurations.
+
+        Args:
+            proxies (list): The proxies to use, loaded from the proxy sources when None.
+            sent_item_ids (IdWindow): The window of sent item IDs, shared with other processes if given.
+            base_url (str): The Vinted site to scan, a local simulator for benchmarks.
+            data_dir (str): The directory of the state, item store and analytics files.
+            session_pool (SessionPool): The pool requests are sent with, a new SessionPool when None.
+            clock (callable): The function returning the current epoch, a faster clock when replaying a trace.
+            checked_item_ids (IdWindow): The window of probed item IDs, shared with other processes if given.
         """
-        self.get_item_details_start_time = time.time()
-        self.get_item_details_request_count = 0
+        self.base_url = base_url
+        self.data_dir = data_dir
+        self.clock = clock
+        self.stopped = threading.Event()
 
         self.catalog_items = 5000
         self.rate_limit_errors = 0
@@ -34,26 +84,64 @@ class Vinted:
         self.workers = self.max_workers
         self.lock = threading.Lock()
 
+        self.engine = 'async'  # 'async' or 'threaded'
+        self.probe_concurrency = 256  # In-flight requests of the async engine
+        self.miss_limit = 100  # Consecutive misses before the frontier counts as passed
+
         self.last_id = 0
         self.request_timeout = 3  # Seconds
+        self.hedge_requests = True  # Duplicate slow probes of IDs near the predicted frontier through another proxy
         self.maximum_delay = 15  # Seconds
         settings = self._read_settings()
-        self.brand_ids = settings['brand_ids']
-        self.size_ids = settings['size_ids']
-        self.country_ids = settings['country_ids']
-        self.checked_item_ids = set()  # Initialize the set to keep track of checked item IDs
-        self.sent_item_ids = set()  # Initialize the set to keep track of sent item IDs
+        self.item_filter = ItemFilter(settings, maximum_delay=self.maximum_delay)
+        # Keep track of the item IDs that resolved, sent or not, over a sliding window
+        self.checked_item_ids = checked_item_ids if checked_item_ids is not None else IdWindow()
+        self.sent_item_ids = sent_item_ids if sent_item_ids is not None else IdWindow()  # Keep track of sent item IDs
 
         self.lowest_offset = None
         self.highest_offset = None
+        self.frontier = FrontierEstimator(max_window=self.catalog_items, clock=self.clock)
+        self.reprobes = ReprobeScheduler(clock=self.clock)  # 404s near the frontier, probed again until they resolve
+        self.state_store = StateStore(os.path.join(self.data_dir, 'state.db'))
+        self.restore_state()
+        self.catalog_poller = CatalogPoller(self, interval=1.0)
+        self.watch_catalog = True  # Also poll the catalog filtered by every watchlist, next to the ID prober
+        self.catalog_watcher = CatalogWatcher(self, per_page=96, interval=2.0)
 
         self._webhook_urls = [
             # 'https://discord.com/api/webhooks/1261692483302199428/yeEIU_BOuH9FUg5OCw0slFrxnAwalXUqJPQeyfHYq8kIboyoxX5H_CmPnn_Pf0NJKFxq'
         ]
 
         logging.info("Starting new Vinted session")
-        self.proxy_manager = ProxyManager()
-        self.cookies = self.get_session_cookie()
+        self.proxy_manager = ProxyManager(proxies)
+        self.proxy_manager.probe_url = f'{self.base_url}/robots.txt'
+        self.proxy_manager.start_health_checks()
+        self.rate_limiter = ProxyRateLimiter()
+        self.session_pool = session_pool if session_pool is not None else SessionPool()
+        self.alert_dispatcher = AlertDispatcher(self.session_pool)
+        self.alert_dispatcher.start()
+        self.analytics_format = 'csv'  # 'csv', 'jsonl' or 'parquet'
+        self.analytics_sink = AnalyticsSink.for_format(self.analytics_format, directory=self.data_dir)
+        self.item_store_sink = AnalyticsSink(ItemStore(os.path.join(self.data_dir, 'items.db')))
+        self.store_probed_hits = False  # Also store found items that did not match, not only alerted ones
+        self.metrics_port = 9100  # Port of the /metrics endpoint started by __main__
+        self.cookie_pool = CookiePool(self)
+        self.request_executor = RequestExecutor(self, headers=API_HEADERS)
+        self._register_metrics()
+        self.cookie_pool.start()
+
+    def _register_metrics(self):
+        """
+        Report the worker count, queue depths and allocation rate of this instance when the metrics are scraped.
+        """
+        WORKERS.set_function(lambda: self.workers if self.engine == 'threaded' else self.probe_concurrency)
+        QUEUE_DEPTH.set_function(self.alert_dispatcher.queue.qsize, 'alerts')
+        QUEUE_DEPTH.set_function(lambda: sum(len(embeds) for embeds in list(self.alert_dispatcher.pending.values())), 'alerts_pending')
+        QUEUE_DEPTH.set_function(lambda: len(self.analytics_sink.buffer), 'analytics')
+        QUEUE_DEPTH.set_function(lambda: len(self.item_store_sink.buffer), 'item_store')
+        QUEUE_DEPTH.set_function(lambda: len(self.reprobes), 'reprobes')
+        ID_RATE.set_function(lambda: self.frontier.rate)
+        SESSIONS.set_function(self.cookie_pool.valid_count)
 
     def _read_settings(self):
         """
@@ -65,21 +153,64 @@ class Vinted:
         with open('config/settings.json', 'r') as file:
             return json.load(file)
 
-    def get_session_cookie(self):
+    def restore_state(self):
+        """
+        Restore the frontier, offsets and sent item IDs from the state store.
+
+        An empty store is seeded from the sent items CSV file first.
+        """
+        state = self.state_store.load()
+        if not state['sent_item_ids'] and 'last_id' not in state:
+            self.state_store.import_csv(os.path.join(self.data_dir, 'sent_items.csv'))
+            state = self.state_store.load()
+
+        if state['sent_item_ids']:
+            # Older IDs fall outside the dedup window and count as sent anyway
+            oldest = state['sent_item_ids'][-1] - self.sent_item_ids.size
+            for item_id in state['sent_item_ids']:
+                if item_id > oldest:
+                    self.sent_item_ids.add(item_id)
+
+        self.last_id = state.get('last_id', self.last_id)
+        self.lowest_offset = state.get('lowest_offset', self.lowest_offset)
+        self.highest_offset = state.get('highest_offset', self.highest_offset)
+        if 'frontier' in state:
+            self.frontier.restore(state['frontier'])
+
+        self.state_store.prune()
+        logging.info("Restored state with last ID %s and %s sent items", self.last_id, len(state['sent_item_ids']))
+
+    def save_state(self):
+        """
+        Checkpoint the frontier and offsets to the state store.
+        """
+        self.state_store.checkpoint(
+            last_id=int(self.last_id),
+            lowest_offset=self.lowest_offset,
+            highest_offset=self.highest_offset,
+            frontier=self.frontier.snapshot()
+        )
+
+    def get_session_cookie(self, proxy=None):
         """
         Retrieve a session cookie from Vinted.
 
+        Args:
+            proxy (dict): The proxy to retrieve the cookie through, a proxy from the proxy manager when None.
+
         Returns:
             dict: A dictionary containing the session cookies.
         """
-        logging.info("Getting session cookie")
-
-        data = requests.get('https://www.vinted.co.uk', impersonate='chrome', proxies=self.proxy_manager.get_proxy())
-        data.raise_for_status()
+        if proxy is None:
+            proxy = self.proxy_manager.get_proxy()
+        logging.info("Getting session cookie through proxy %s", proxy_label(ProxyManager.proxy_key(proxy)))
 
-        return data.cookies.get_dict()
+        with self.session_pool.session(proxy) as session:
+            data = session.get(self.base_url, proxies=proxy, impersonate='chrome')
+            data.raise_for_status()
+            # The response shares the jar of the session, which is emptied once it is checked back in
+            return data.cookies.get_dict()
 
-    @retry(stop_max_attempt_number=3)
     def get_catalog_items(self, amount=1):
         """
         Retrieve the newest items from the Vinted catalog.
@@ -90,34 +221,13 @@ class Vinted:
         Returns:
             list: A list of items from the catalog.
         """
-        logging.info(f"Getting {amount} newest items from Vinted catalog")
-
-        data = requests.get(
-            url=f'https://www.vinted.co.uk/api/v2/catalog/items?per_page={amount}&order=newest_first',
-            headers={
-                'Cache-Control': 'no-cache',
-                'Referer': 'https://vinted.co.uk/',
-                'Origin': 'https://www.vinted.co.uk/catalog',
-                'Platform': 'Windows',
-                'Accept-Language': 'en-GB',
-                'Content-Type': "application/json",
-            },
-            cookies=self.cookies,
-            proxies=self.proxy_manager.get_proxy(),
-            impersonate='chrome'
-        )
-
-        if data.status_code in [401]:
-            self.cookies = self.get_session_cookie()
-            return self.get_catalog_items(amount)
-        elif data.status_code == 429:
-            time.sleep(1)
+        logging.info("Getting %s newest items from Vinted catalog", amount)
 
+        data = self.request_executor.get('catalog', f'{self.base_url}/api/v2/catalog/items?per_page={amount}&order=newest_first')
         data.raise_for_status()
 
         return data.json().get('items', [])
 
-    @retry(stop_max_attempt_number=1)
     def get_item_details(self, item_id):
         """
         Retrieve details for a specific item.
@@ -128,109 +238,159 @@ class Vinted:
         Returns:
             dict: A dictionary containing the item details.
         """
-        data = requests.get(
-            url=f'https://www.vinted.co.uk/api/v2/items/{item_id}',
-            headers={
-                'Cache-Control': 'no-cache',
-                'Referer': 'https://vinted.co.uk/',
-                'Origin': 'https://www.vinted.co.uk/catalog',
-                'Platform': 'Windows',
-                'Accept-Language': 'en-GB',
-                'Content-Type': "application/json"
-            },
-            cookies=self.cookies,
-            proxies=self.proxy_manager.get_proxy(),
-            timeout=self.request_timeout,
-            impersonate='chrome'
-        )
+        hedge = self.hedge_requests and self.frontier.is_hot(item_id)
+        try:
+            data = self.request_executor.get(
+                'item', f'{self.base_url}/api/v2/items/{item_id}', timeout=self.request_timeout, hedge=hedge
+            )
+        except Exception:
+            PROBES.inc('error')
+            raise
 
-        self.get_item_details_request_count += 1
-        elapsed_time = time.time() - self.get_item_details_start_time
-        if elapsed_time > 0:
-            rps = self.get_item_details_request_count / elapsed_time
-        else:
-            rps = 0
+        return self._parse_item_response(item_id, data)
 
-        # logging.info(f"item_id: {item_id}\tstatus_code: {data.status_code}\toffset: {int(item_id) - int(self.last_id)}\trate_limit_errors: {self.rate_limit_errors}\tworkers: {self.workers}")
-        logging.info(f"item_id: {item_id}\tstatus_code: {data.status_code}\toffset: {int(item_id) - int(self.last_id)}\trate_limit_errors: {self.rate_limit_errors}\tworkers: {self.workers}\trequests_per_second: {rps:.2f}")
-        if data.status_code == 429:
+    async def get_item_details_async(self, session, item_id, proxy=None):
+        """
+        Retrieve details for a specific item over an asynchronous session.
+
+        Args:
+            session (AsyncSession): The curl_cffi session to send the request with.
+            item_id (int): The ID of the item to retrieve details for.
+            proxy (dict): The proxy whose rate limiter slot was reserved for the request, picked when None.
+
+        Returns:
+            dict: A dictionary containing the item details.
+        """
+        hedge = self.hedge_requests and self.frontier.is_hot(item_id)
+        try:
+            data = await self.request_executor.get_async(
+                session, 'item', f'{self.base_url}/api/v2/items/{item_id}', timeout=self.request_timeout, hedge=hedge,
+                proxy=proxy
+            )
+        except Exception:
+            PROBES.inc('error')
+            raise
+
+        return self._parse_item_response(item_id, data)
+
+    def _record_proxy_result(self, proxy, started, status_code=None, error=None, cookies=None):
+        """
+        Feed the outcome of a request back into the proxy health scores, the rate limiter and the cookie pool.
+
+        Args:
+            proxy (dict): The proxy the request was sent through.
+            started (float): The epoch at which the request was sent.
+            status_code (int): The HTTP status code of the response, if there was one.
+            error (Exception): The exception the request raised, if any.
+            cookies (dict): The session cookies the request was sent with.
+        """
+        latency = time.time() - started
+        if self.proxy_manager.report(proxy, latency=latency, status_code=status_code, error=error):
+            # Its kept-alive tunnels are not worth reusing once the proxy is back
+            self.session_pool.discard(proxy)
+        PROXY_LATENCY.observe(latency, proxy_label(ProxyManager.proxy_key(proxy)))
+        stage_timers.record('network', latency)
+        if status_code is not None:
+            self.rate_limiter.record(proxy, status_code)
+        if status_code == 429:
             with self.lock:
                 self.rate_limit_errors += 1
+        elif status_code == 401:
+            self.cookie_pool.invalidate(cookies)
+
+    def _parse_item_response(self, item_id, data):
+        """
+        Turn an item details response into the item details, or None if there is no item.
+
+        Args:
+            item_id (int): The ID of the requested item.
+            data (Response): The response of the item details request.
+
+        Returns:
+            dict: A dictionary containing the item details, empty if the item exists but cannot match.
+        """
+        PROBES.inc(data.status_code)
+
+        if sample_probe():
+            logging.info(
+                "item_id: %(item_id)s\tstatus_code: %(status_code)s\toffset: %(offset)s\trate_limit_errors: %(rate_limit_errors)s\tworkers: %(workers)s",
+                {
+                    'item_id': int(item_id),
+                    'status_code': data.status_code,
+                    'offset': int(item_id) - int(self.last_id),
+                    'rate_limit_errors': self.rate_limit_errors,
+                    'workers': self.workers,
+                }
+            )
+        if data.status_code == 429:
             return None
 
         if data.status_code in [404]:
+            # The item may not be visible yet, probe it again before the sweeps move past it
+            if self.frontier.is_hot(item_id):
+                self.reprobes.schedule(item_id)
             return None
 
         data.raise_for_status()
 
-        data_json = data.json()
+        raw = data.content
+        started = stage_timers.start()
+        prefiltered = b'"code":0' in raw and not self.item_filter.prefilter(raw)
+        stage_timers.stop('prefilter', started)
+        if prefiltered:
+            # The item exists but cannot match, skip decoding the photos, description and user
+            ITEMS.inc('prefiltered')
+            self.frontier.observe(item_id)
+            self.reprobes.resolve(item_id)
+            return {}
+
+        started = stage_timers.start()
+        data_json = orjson.loads(raw) if orjson is not None else json.loads(raw)
+        stage_timers.stop('decode', started)
 
         if data_json.get('code') != 0:
             return None
 
+        self.frontier.observe(item_id)
+        self.reprobes.resolve(item_id)
+
         return data_json
 
-    def append_to_csv(self, item, embed_fields):
+    def send_alert(self, match, path='probe'):
         """
-        Append item details to a CSV file.
+        Send a matched item to the webhooks of the watchlists it matched.
 
         Args:
-            item (dict): The item details.
-            embed_fields (list): A list of embedded fields to include in the CSV.
-        """
-        csv_file_path = 'sent_items.csv'
-        csv_headers = ["Item ID", "Price", "Size", "Brand", "User Rating", "Condition", "Country", "Discovery Time",
-                       "Current Epoch", "Item Epoch", "Lowest Offset", "Highest Offset", "Current Offset"]
-
-        # Check if CSV exists, if not, create it and write headers
-        if not os.path.exists(csv_file_path):
-            with open(csv_file_path, mode='w', newline='', encoding='utf-8') as fh:
-                writer = csv.writer(fh)
-                writer.writerow(csv_headers)
-
-        # Extract data from embed_fields
-        data_row = [
-            item['id'],
-            next((field['value'] for field in embed_fields if field['name'] == "💰 Price"), None),
-            next((field['value'] for field in embed_fields if field['name'] == "📏 Size"), None),
-            next((field['value'] for field in embed_fields if field['name'] == "🏷️ Brand"), None),
-            next((field['value'] for field in embed_fields if field['name'] == "⭐️ User Rating"), None),
-            next((field['value'] for field in embed_fields if field['name'] == "📦 Condition"), None),
-            item['user']['country_code'],
-            next((field['value'] for field in embed_fields if field['name'] == 'Discovery time'), None),
-            next((field['value'] for field in embed_fields if field['name'] == 'Current epoch'), None),
-            next((field['value'] for field in embed_fields if field['name'] == 'Item epoch'), None),
-            next((field['value'] for field in embed_fields if field['name'] == "Lowest Offset"), None),
-            next((field['value'] for field in embed_fields if field['name'] == "Highest Offset"), None),
-            next((field['value'] for field in embed_fields if field['name'] == "Current Offset"), None),
-        ]
-
-        with open(csv_file_path, mode='a', newline='', encoding='utf-8') as fh:
-            writer = csv.writer(fh)
-            writer.writerow(data_row)
-
-        return True
+            match (ItemMatch): The item that passed the filter.
+            path (str): The path that discovered the item, 'probe' or 'catalog'.
+        """
+        started = stage_timers.start()
+        self.send_discord_message(match.item, epoch_time=match.epoch, webhook_urls=match.webhook_urls(self._webhook_urls), path=path)
+        stage_timers.stop('alert', started)
 
-    def send_discord_message(self, item):
+    def send_discord_message(self, item, epoch_time=None, webhook_urls=None, path='probe'):
         """
         Send a message to Discord with item details.
 
         Args:
             item (dict): The item details.
+            epoch_time (int): The epoch the item was last updated at, parsed from the item when None.
+            webhook_urls (list): The webhooks to send the message to, the default webhooks when None.
+            path (str): The path that discovered the item, 'probe' or 'catalog'.
         """
-        logging.info(f"Sending Discord message for item {item['id']}")
+        logging.info("Sending Discord message for item %s", item['id'])
         label_price = f'{item["price"]["amount"]} {item["price"]["currency_code"]}'
         label_size = item['size']
         label_brand = item['brand']
         label_user_rating = ('⭐️' * round(item['user']['feedback_reputation'] * 5)) + '☆' * (
                     5 - round(item['user']['feedback_reputation'] * 5))
         label_condition = item['status']
-        label_updated_at = item['updated_at_ts']
-        dt_obj = datetime.fromisoformat(label_updated_at)
-        dt_obj_utc = dt_obj.astimezone(timezone.utc)
-        epoch_time = int(dt_obj_utc.timestamp())
-        current_time_epoch = int(time.time())
+        if epoch_time is None:
+            epoch_time = parse_epoch(item['updated_at_ts'])
+        current_time_epoch = int(self.clock())
         time_difference = current_time_epoch - epoch_time
+        DISCOVERY_LATENCY.observe(time_difference, path)
+        DISCOVERIES.inc(path)
 
         if 'photos' in item and item['photos']:
             photo_embed = item['photos'][0]['full_size_url']
@@ -273,67 +433,129 @@ class Vinted:
             "fields": embed_fields
         }
 
-        data = {
-            "embeds": [embed_data]
+        # FIXME: Remove this in 'production', this is added to generate statistics and generate timelines for analysis
+        record = {
+            'item_id': item['id'],
+            'price': label_price,
+            'size': label_size,
+            'brand': label_brand,
+            'user_rating': f"{label_user_rating} ({item['user']['feedback_count']})",
+            'condition': label_condition,
+            'country': item['user']['country_code'],
+            'discovery_time': f'{time_difference} seconds',
+            'current_epoch': current_time_epoch,
+            'item_epoch': epoch_time,
+            'lowest_offset': self.lowest_offset,
+            'highest_offset': self.highest_offset,
+            'current_offset': offset,
+            'price_amount': float(item['price']['amount']),
+            'currency_code': item['price']['currency_code'],
+            'discovery_seconds': time_difference,
+            'brand_id': item['brand_id'],
+            'size_id': item['size_id'],
+            'seller_id': item['user'].get('id'),
+            'seller_rating': item['user']['feedback_reputation'] * 5,
+            'seller_feedback_count': item['user']['feedback_count'],
         }
+        self.analytics_sink.record(record)
+        self.item_store_sink.record(record)
 
-        # FIXME: Remove this in 'production', this is added to generate statistics and generate timelines for analysis
-        self.append_to_csv(item, embed_fields)
+        self.alert_dispatcher.submit(webhook_urls if webhook_urls is not None else self._webhook_urls, embed_data)
+
+        self.state_store.record_sent(item['id'])
+
+        logging.info(
+            "Discord message(s) queued for item %(item_id)s, discovered after %(discovery_seconds)s seconds at offset %(current_offset)s",
+            record
+        )
+
+    def is_processed(self, item_id):
+        """
+        Check whether an item ID already resolved to an item, whether or not it was sent.
+
+        Args:
+            item_id (int): The ID of the item.
+
+        Returns:
+            bool: True if the item does not need to be probed again.
+        """
+        return int(item_id) in self.checked_item_ids or int(item_id) in self.sent_item_ids
+
+    def select_item(self, item_details):
+        """
+        Apply the configured filters to item details and mark the item as sent when it passes.
+
+        Args:
+            item_details (dict): The item details as returned by the item API.
+
+        Returns:
+            ItemMatch: The match if the item should be sent, None otherwise.
+        """
+        item = item_details.get('item')
+        if item is None:
+            return None
+
+        # Rejected items are not fetched again by later sweeps or the catalog watcher
+        self.checked_item_ids.add(item['id'])
+        started = stage_timers.start()
+        match = self.item_filter.match(item, now=self.clock())
+        stage_timers.stop('filter', started)
+        if match is None:
+            ITEMS.inc('rejected')
+            if self.store_probed_hits:
+                self.item_store_sink.record({
+                    'item_id': item['id'],
+                    'price_amount': float(item['price']['amount']),
+                    'currency_code': item['price']['currency_code'],
+                    'brand': item.get('brand'),
+                    'brand_id': item.get('brand_id'),
+                    'size': item.get('size'),
+                    'size_id': item.get('size_id'),
+                    'condition': item.get('status'),
+                    'seller_id': item['user'].get('id'),
+                    'current_epoch': int(self.clock()),
+                    'current_offset': int(item['id']) - int(self.last_id),
+                    'alerted': False,
+                })
+            return None
+
+        if not self.sent_item_ids.add(item['id']):
+            # Another worker got to this item first
+            ITEMS.inc('duplicate')
+            return None
 
-        for webhook_url in self._webhook_urls:
-            response = requests.post(webhook_url, json=data)
-            response.raise_for_status()
+        ITEMS.inc('matched')
 
-        logging.info(f"Discord message(s) sent for item {item['id']}")
+        return match
 
-    def process_possible_item_id(self, item_id):
+    def process_possible_item_id(self, item_id, path='probe'):
         """
         Process a possible item ID by checking its details and sending a Discord message if it meets criteria.
 
         Args:
             item_id (int): The ID of the item to process.
+            path (str): The path that discovered the ID, 'probe' or 'catalog'.
 
         Returns:
             bool: True if the item was processed and sent, False otherwise.
         """
-        if int(item_id) in self.checked_item_ids:
-            return False
-
-        if int(item_id) in self.sent_item_ids:
+        if self.is_processed(item_id):
             return False
 
         try:
             item_details = self.get_item_details(item_id)
         except Exception as e:
-            logging.error(f"Exception occurred: {e}")
+            logging.error("Exception occurred: %s", e)
             return False
 
         if item_details is None:
             return None
 
-        item = item_details.get('item')
-
-        if item['country_id'] not in self.country_ids:
-            return False
-
-        if item['size_id'] not in self.size_ids:
-            return False
-
-        if item['brand_id'] not in self.brand_ids:
-            return False
-
-        updated_at = item['updated_at_ts']
-        dt_obj = datetime.fromisoformat(updated_at)
-        dt_obj_utc = dt_obj.astimezone(timezone.utc)
-        epoch_time = int(dt_obj_utc.timestamp())
-        current_epoch_time = int(datetime.now(timezone.utc).timestamp())
-
-        if current_epoch_time - epoch_time > self.maximum_delay:
+        match = self.select_item(item_details)
+        if match is None:
             return False
 
-        self.checked_item_ids.add(int(item['id']))
-        self.sent_item_ids.add(int(item['id']))
-        self.send_discord_message(item)
+        self.send_alert(match, path=path)
 
         return True
 
@@ -351,47 +573,174 @@ class Vinted:
 
     def monitor_catalog(self):
         """
-        Monitor the Vinted catalog for new items and process them.
+        Monitor the Vinted catalog for new items and process them with the configured engine.
         """
-        while True:
-            self.adjust_workers_based_on_rate_limit()
-            self.rate_limit_errors = 0
+        self.catalog_poller.start()
+        if self.watch_catalog:
+            self.catalog_watcher.start()
+        try:
+            if self.engine == 'async':
+                asyncio.run(self.monitor_catalog_async())
+            else:
+                self.monitor_catalog_threaded()
+        finally:
+            self.catalog_watcher.stop()
+            self.catalog_poller.stop()
+            self.close()
+
+    def stop(self):
+        """
+        Stop monitoring the catalog after the current sweep.
+        """
+        self.stopped.set()
+
+    def close(self):
+        """
+        Stop the cookie refreshes, send the queued alerts, write the buffered analytics and item store
+        records and close the state store and the pooled sessions.
+        """
+        self.cookie_pool.stop()
+        self.alert_dispatcher.stop()
+        self.analytics_sink.close()
+        self.item_store_sink.close()
+        self.state_store.close()
+        self.session_pool.close()
+
+    def wait_for_catalog_head(self):
+        """
+        Wait until the catalog poller has published a head.
+
+        Returns:
+            int: The newest catalog head, or None if monitoring was stopped first.
+        """
+        while not self.stopped.is_set():
+            head_id = self.catalog_poller.wait_for_head(timeout=1.0)
+            if head_id is not None:
+                return head_id
+
+        return None
+
+    async def monitor_catalog_async(self):
+        """
+        Monitor the Vinted catalog for new items with the asyncio probing engine.
+
+        The engine keeps `probe_concurrency` probes in flight across sweeps, each sweep starting
+        from the newest head published by the catalog poller as soon as the previous one is over.
+        """
+        async def next_sweep(stats):
+            if stats is not None:
+                self.frontier.end_sweep()
+                await asyncio.to_thread(self.save_state)
+                logging.debug("Probed %(probed)s items, %(misses)s misses, %(reprobed)s re-probes, %(sent)s sent", stats)
+
+            if self.catalog_poller.head_id is None and await asyncio.to_thread(self.wait_for_catalog_head) is None:
+                return None
+            if self.stopped.is_set():
+                return None
 
-            with concurrent.futures.ThreadPoolExecutor(max_workers=self.workers) as executor:
-                catalog_items = self.get_catalog_items()
-                if not catalog_items:
+            self.request_executor.new_cycle()
+            return self.frontier.begin_sweep(self.last_id)
+
+        async with AsyncProbeEngine(self, concurrency=self.probe_concurrency, miss_limit=self.miss_limit) as engine:
+            await engine.run(next_sweep)
+
+    def _next_sweep(self):
+        """
+        Start a sweep of the threaded engine from the newest published catalog head.
+
+        Returns:
+            iterator: The item IDs of the sweep, empty if monitoring was stopped.
+        """
+        self.adjust_workers_based_on_rate_limit()
+        self.rate_limit_errors = 0
+
+        if self.wait_for_catalog_head() is None:
+            return iter(())
+
+        self.request_executor.new_cycle()
+        return iter(self.frontier.begin_sweep(self.last_id))
+
+    def monitor_catalog_threaded(self):
+        """
+        Monitor the Vinted catalog for new items with a long-lived thread pool.
+
+        `workers` probes are kept in flight at all times. When a sweep runs out of IDs or hits
+        `miss_limit` consecutive misses, the next sweep starts right away from the newest catalog
+        head, while the stragglers of the previous sweep finish in the background. Due re-probes
+        go before the IDs of the sweep and do not count as misses.
+        """
+        sweep = 0
+        misses = 0
+        item_ids = iter(())
+        in_flight = {}  # Future -> sweep it belongs to, None for re-probes
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            while not self.stopped.is_set():
+                while len(in_flight) < self.workers and not self.stopped.is_set():
+                    item_id = self.reprobes.pop_due()
+                    if item_id is not None:
+                        in_flight[executor.submit(self.process_possible_item_id, item_id)] = None
+                        continue
+
+                    item_id = next(item_ids, None) if misses < self.miss_limit else None
+                    if item_id is None:
+                        if misses >= self.miss_limit:
+                            logging.debug("%s products failed to resolve, starting the next sweep.", self.miss_limit)
+                        if sweep:
+                            self.frontier.end_sweep()
+                            self.save_state()
+                        item_ids = self._next_sweep()
+                        sweep += 1
+                        misses = 0
+                        continue
+
+                    in_flight[executor.submit(self.process_possible_item_id, item_id)] = sweep
+
+                if not in_flight:
                     continue
 
-                catalog_item = catalog_items[0]
-                if int(catalog_item['id']) >= int(self.last_id):
-                    self.last_id = catalog_item['id']
-
-                    id_list = list(range(self.last_id + 0, self.last_id + self.catalog_items))
-                    futures = {executor.submit(self.process_possible_item_id, item_id): item_id for item_id in id_list}
-
-                    none_counter = 0
-                    for future in concurrent.futures.as_completed(futures):
-                        try:
-                            result = future.result()
-                            if result is None:
-                                none_counter += 1
-                                if none_counter >= 100:
-                                    logging.debug("100 products failed to resolve, retrieving new catalog items.")
-                                    break
-                            else:
-                                none_counter = 0
-                        except Exception as e:
-                            logging.error(f"Exception occurred: {e}")
-
-                    # Cancel any remaining futures
-                    for future in futures:
-                        if not future.done():
-                            future.cancel()
-                elif int(catalog_item['id']) < int(self.last_id):
-                    logging.error("Detected a lower item ID than the last ID, retrieving new cookies.")
-                    self.cookies = self.get_session_cookie()
+                done, _ = concurrent.futures.wait(in_flight, timeout=1.0, return_when=concurrent.futures.FIRST_COMPLETED)
+                for future in done:
+                    future_sweep = in_flight.pop(future)
+                    try:
+                        result = future.result()
+                    except Exception as e:
+                        logging.error("Exception occurred: %s", e)
+                        continue
+
+                    if future_sweep != sweep:
+                        continue
+                    if result is None:
+                        misses += 1
+                    else:
+                        misses = 0
+
+            for future in in_flight:
+                future.cancel()
 
 
 if __name__ == '__main__':
-    vinted = Vinted()
-    vinted.monitor_catalog()
+    parser = argparse.ArgumentParser(description='Monitor the Vinted catalog for new items.')
+    parser.add_argument('--processes', type=int, default=1, help='The number of sharded scanner processes.')
+    parser.add_argument('--log-level', default='DEBUG', help='The log level.')
+    parser.add_argument('--log-json', action='store_true', help='Write the log as one JSON object per line.')
+    parser.add_argument('--probe-log-sample', type=int, default=100, help='Log one probe in N, 0 to log none.')
+    parser.add_argument('--profile', type=float, metavar='SECONDS', help='Capture a profile of the first N seconds.')
+    parser.add_argument('--profile-dir', default='.', help='The directory profiles are written to.')
+    parser.add_argument('--stage-timers', action='store_true', help='Keep the per-stage timers of /metrics always on.')
+    args = parser.parse_args()
+
+    log_options = {'level': args.log_level, 'json_output': args.log_json, 'probe_sample': args.probe_log_sample}
+    configure_logging(**log_options)
+    install_signal_handler(directory=args.profile_dir)
+    stage_timers.enabled = args.stage_timers
+    if args.profile:
+        start_capture(args.profile, args.profile_dir)
+
+    if args.processes > 1:
+        from sharded_scanner import ShardedScanner
+        ShardedScanner(processes=args.processes, log_options=log_options).run()
+    else:
+        vinted = Vinted()
+        start_metrics_server(vinted.metrics_port)
+        vinted.monitor_catalog()
@@ -0,0 +1,325 @@
+import bisect
+import functools
+import logging
+import threading
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit
+
+LATENCY_BUCKETS = (0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+DISCOVERY_BUCKETS = (1, 2, 3, 5, 8, 10, 15, 30, 60, 120)
+STAGE_BUCKETS = (0.00001, 0.00005, 0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0)
+
+
+@functools.lru_cache(maxsize=4096)
+def proxy_label(proxy_url):
+    """
+    Get the label a proxy is reported under, without its password.
+
+    Args:
+        proxy_url (str): The proxy URL, or None for direct requests.
+
+    Returns:
+        str: The user, host and port of the proxy, or 'direct'.
+    """
+    if not proxy_url:
+        return 'direct'
+
+    url = urlsplit(proxy_url)
+    user = f'{url.username}@' if url.username else ''
+
+    return f'{user}{url.hostname}:{url.port}'
+
+
+def format_labels(names, values, extra=()):
+    pairs = [*zip(names, values), *extra]
+    if not pairs:
+        return ''
+
+    escaped = (str(value).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n') for _, value in pairs)
+
+    return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + '}'
+
+
+def label_order(item):
+    return tuple(str(value) for value in item[0])
+
+
+def format_value(value):
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+class Metric:
+    TYPE = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        """
+        Initialize a metric whose values are kept per thread.
+
+        Every thread increments a dict that only it writes to, so recording a value never takes a
+        lock. The shards are only summed when the metrics are scraped, and copying a dict is atomic.
+        The shards of threads that exited are folded into one, so short-lived worker threads do not
+        pile up.
+
+        Args:
+            name (str): The name of the metric.
+            documentation (str): The help text of the metric.
+            labelnames (tuple): The names of the labels, in the order their values are passed.
+        """
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._shards = []  # (thread, values) of every thread that recorded a value
+        self._retired = {}  # Values of the threads that exited
+
+    def _shard(self):
+        try:
+            return self._local.values
+        except AttributeError:
+            values = self._local.values = {}
+            with self._lock:
+                self._retire()
+                self._shards.append((threading.current_thread(), values))
+            return values
+
+    def _retire(self):
+        live = []
+        for thread, values in self._shards:
+            if thread.is_alive():
+                live.append((thread, values))
+            else:
+                for labelvalues, value in values.items():
+                    self._retired[labelvalues] = self._merge(self._retired.get(labelvalues), value)
+        self._shards = live
+
+    def _merge(self, total, value):
+        raise NotImplementedError
+
+    def collect(self):
+        """
+        Sum the values of all threads.
+
+        Returns:
+            dict: Label values -> total.
+        """
+        with self._lock:
+            self._retire()
+            totals = {labelvalues: self._merge(None, value) for labelvalues, value in self._retired.items()}
+            shards = [values for _, values in self._shards]
+
+        for shard in shards:
+            for labelvalues, value in shard.copy().items():
+                totals[labelvalues] = self._merge(totals.get(labelvalues), value)
+
+        return totals
+
+    def samples(self):
+        raise NotImplementedError
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.TYPE}']
+        lines.extend(f'{name}{labels} {format_value(value)}' for name, labels, value in self.samples())
+
+        return '\n'.join(lines)
+
+
+class Counter(Metric):
+    TYPE = 'counter'
+
+    def inc(self, *labelvalues, amount=1):
+        """
+        Increment the counter of a label combination.
+
+        Args:
+            *labelvalues: The values of the labels.
+            amount (float): The amount to add.
+        """
+        values = self._shard()
+        values[labelvalues] = values.get(labelvalues, 0) + amount
+
+    def _merge(self, total, value):
+        return value if total is None else total + value
+
+    def samples(self):
+        for labelvalues, value in sorted(self.collect().items(), key=label_order):
+            yield self.name, format_labels(self.labelnames, labelvalues), value
+
+
+class Histogram(Metric):
+    TYPE = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        """
+        Initialize a histogram whose observations are counted per thread.
+
+        Args:
+            name (str): The name of the metric.
+            documentation (str): The help text of the metric.
+            labelnames (tuple): The names of the labels, in the order their values are passed.
+            buckets (tuple): The upper bounds of the buckets, in increasing order.
+        """
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, *labelvalues):
+        """
+        Record an observation for a label combination.
+
+        Args:
+            value (float): The observed value.
+            *labelvalues: The values of the labels.
+        """
+        values = self._shard()
+        state = values.get(labelvalues)
+        if state is None:
+            # Bucket counts (the last one is +Inf), then the sum
+            state = values[labelvalues] = [0] * (len(self.buckets) + 2)
+        state[bisect.bisect_left(self.buckets, value)] += 1
+        state[-1] += value
+
+    def _merge(self, total, state):
+        state = list(state)
+        return state if total is None else [a + b for a, b in zip(total, state)]
+
+    def samples(self):
+        for labelvalues, state in sorted(self.collect().items(), key=label_order):
+            cumulative = 0
+            for bound, count in zip((*self.buckets, '+Inf'), state[:-1]):
+                cumulative += count
+                yield f'{self.name}_bucket', format_labels(self.labelnames, labelvalues, [('le', bound)]), cumulative
+            yield f'{self.name}_sum', format_labels(self.labelnames, labelvalues), state[-1]
+            yield f'{self.name}_count', format_labels(self.labelnames, labelvalues), cumulative
+
+
+class Gauge(Metric):
+    TYPE = 'gauge'
+
+    def __init__(self, name, documentation, labelnames=()):
+        """
+        Initialize a gauge that is either set directly or read from a function when scraped.
+
+        Args:
+            name (str): The name of the metric.
+            documentation (str): The help text of the metric.
+            labelnames (tuple): The names of the labels, in the order their values are passed.
+        """
+        super().__init__(name, documentation, labelnames)
+        self.values = {}
+        self.functions = {}
+
+    def set(self, value, *labelvalues):
+        self.values[labelvalues] = value
+
+    def set_function(self, function, *labelvalues):
+        """
+        Read the value of a label combination from a function whenever the metrics are scraped.
+
+        Args:
+            function (callable): The function returning the current value.
+            *labelvalues: The values of the labels.
+        """
+        self.functions[labelvalues] = function
+
+    def samples(self):
+        values = dict(self.values)
+        for labelvalues, function in list(self.functions.items()):
+            try:
+                value = function()
+            except Exception as e:
+                logging.debug("Failed to read gauge %s: %s", self.name, e)
+                continue
+            if value is not None:
+                values[labelvalues] = value
+
+        for labelvalues, value in sorted(values.items(), key=label_order):
+            yield self.name, format_labels(self.labelnames, labelvalues), value
+
+
+class Registry:
+    def __init__(self):
+        """
+        Initialize a registry of metrics that renders them in the Prometheus text format.
+        """
+        self.lock = threading.Lock()
+        self.metrics = {}
+
+    def _register(self, metric_class, name, *args, **kwargs):
+        with self.lock:
+            metric = self.metrics.get(name)
+            if metric is None:
+                metric = self.metrics[name] = metric_class(name, *args, **kwargs)
+            elif not isinstance(metric, metric_class):
+                raise ValueError(f"Metric {name} is already registered as a {metric.TYPE}.")
+
+        return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self._register(Counter, name, documentation, labelnames)
+
+    def histogram(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        return self._register(Histogram, name, documentation, labelnames, buckets)
+
+    def gauge(self, name, documentation, labelnames=()):
+        return self._register(Gauge, name, documentation, labelnames)
+
+    def render(self):
+        """
+        Render every metric in the Prometheus text exposition format.
+
+        Returns:
+            str: The metrics.
+        """
+        with self.lock:
+            metrics = list(self.metrics.values())
+
+        return '\n'.join(metric.render() for metric in metrics) + '\n'
+
+
+REGISTRY = Registry()
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    registry = REGISTRY
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        if self.path.split('?', 1)[0] != '/metrics':
+            self.send_error(404)
+            return
+
+        body = self.registry.render().encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def start_metrics_server(port=9100, host='127.0.0.1', registry=REGISTRY):
+    """
+    Serve the metrics on http://host:port/metrics from a background thread.
+
+    Args:
+        port (int): The port to listen on.
+        host (str): The address to listen on, only the local machine by default.
+        registry (Registry): The registry to serve.
+
+    Returns:
+        ThreadingHTTPServer: The server, or None if the port is in use.
+    """
+    handler = type('Handler', (MetricsHandler,), {'registry': registry})
+    try:
+        server = ThreadingHTTPServer((host, port), handler)
+    except OSError as e:
+        logging.error("Failed to serve metrics on port %s: %s", port, e)
+        return None
+
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name='metrics-server', daemon=True).start()
+    logging.info("Serving metrics on http://%s:%s/metrics", host, port)
+
+    return server
@@ -0,0 +1,147 @@
+import asyncio
+import logging
+
+
+class AsyncProbeEngine:
+    def __init__(self, vinted, concurrency=256, miss_limit=100):
+        """
+        Initialize the asyncio probing engine.
+
+        Args:
+            vinted (Vinted): The Vinted instance used for requests, filtering and alerting.
+            concurrency (int): The number of item requests kept in flight at once.
+            miss_limit (int): The number of consecutive misses after which no new IDs are issued.
+        """
+        self.vinted = vinted
+        self.concurrency = concurrency
+        self.miss_limit = miss_limit
+        self.session = None
+
+    async def __aenter__(self):
+        self.session = self.vinted.session_pool.async_session(self.concurrency)
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.session.close()
+        self.session = None
+
+    async def run(self, next_sweep):
+        """
+        Probe sweep after sweep with a fixed pool of in-flight requests until monitoring stops.
+
+        The workers live across sweeps. When a sweep runs out of IDs or `miss_limit` probes of
+        it in a row come back empty, the worker that notices it starts the next sweep right away,
+        while the stragglers of the previous sweep finish in the background and no longer count
+        as its misses. A worker reserves a rate limiter slot before it takes an ID, so IDs are sent
+        as soon as they are taken instead of queueing behind the limiter. IDs that are due for a
+        re-probe go before the next ID of the sweep and do not count as misses.
+
+        Args:
+            next_sweep (callable): Coroutine function called with the counters of the sweep that
+                ended, None before the first sweep, returning the item IDs of the next sweep in
+                probing order, or None to stop.
+
+        Returns:
+            dict: Counters for the probed, missed, re-probed and sent items of the last sweep.
+        """
+        reprobes = self.vinted.reprobes
+        stopped = self.vinted.stopped
+        request_executor = self.vinted.request_executor
+        state = {'sweep': 0, 'item_ids': iter(()), 'none_counter': 0, 'stats': None, 'stopped': False}
+        turnover = asyncio.Lock()
+
+        def cancelled():
+            return state['stopped'] or stopped.is_set()
+
+        async def take():
+            # The next ID of the current sweep and the number of that sweep, starting the next sweep when this one is over
+            while not cancelled():
+                sweep = state['sweep']
+                item_id = next(state['item_ids'], None) if state['none_counter'] < self.miss_limit else None
+                if item_id is not None:
+                    return item_id, sweep
+
+                async with turnover:
+                    if state['sweep'] != sweep:
+                        continue
+                    if state['none_counter'] >= self.miss_limit:
+                        logging.debug("%s products failed to resolve, starting the next sweep.", self.miss_limit)
+
+                    item_ids = await next_sweep(state['stats'])
+                    if item_ids is None:
+                        state['stopped'] = True
+                        break
+                    state.update(sweep=sweep + 1, item_ids=iter(item_ids), none_counter=0,
+                                 stats={'probed': 0, 'misses': 0, 'reprobed': 0, 'sent': 0})
+
+            return None, None
+
+        async def worker():
+            while not cancelled():
+                proxy = await request_executor.reserve_async(cancelled)
+                if proxy is None:
+                    return
+
+                item_id = reprobes.pop_due()
+                if item_id is not None:
+                    result = await self.probe(item_id, proxy)
+                    stats = state['stats']
+                    if stats is not None:
+                        stats['reprobed'] += 1
+                        stats['sent'] += result is True
+                    continue
+
+                item_id, sweep = await take()
+                if item_id is None:
+                    return
+
+                # Counted in the sweep that is running when the probe completes, so no report misses a probe
+                result = await self.probe(item_id, proxy)
+                stats = state['stats']
+                stats['probed'] += 1
+                stats['misses'] += result is None
+                stats['sent'] += result is True
+
+                if sweep != state['sweep']:
+                    # A straggler of a previous sweep
+                    continue
+                if result is None:
+                    state['none_counter'] += 1
+                else:
+                    state['none_counter'] = 0
+
+        await asyncio.gather(*(worker() for _ in range(self.concurrency)))
+
+        return state['stats']
+
+    async def probe(self, item_id, proxy=None):
+        """
+        Probe a single item ID and hand a found item to the Vinted filters.
+
+        Args:
+            item_id (int): The ID of the item to probe.
+            proxy (dict): The proxy whose rate limiter slot was reserved for the probe, picked when None.
+
+        Returns:
+            bool: True if the item was sent, False if it was skipped, None if it does not exist (yet).
+        """
+        if self.vinted.is_processed(item_id):
+            return False
+
+        try:
+            item_details = await self.vinted.get_item_details_async(self.session, item_id, proxy)
+        except Exception as e:
+            logging.error("Exception occurred: %s", e)
+            return False
+
+        if item_details is None:
+            return None
+
+        match = self.vinted.select_item(item_details)
+        if match is None:
+            return False
+
+        # Alerting does blocking I/O, keep it off the event loop
+        await asyncio.to_thread(self.vinted.send_alert, match)
+
+        return True
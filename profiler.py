@@ -0,0 +1,203 @@
+import logging
+import os
+import signal
+import sys
+import threading
+import time
+
+from metrics import REGISTRY, STAGE_BUCKETS
+
+STAGE_SECONDS = REGISTRY.histogram(
+    'vinted_stage_seconds', 'Wall-clock seconds per processing stage, recorded while stage timers are enabled.', ['stage'],
+    buckets=STAGE_BUCKETS
+)
+
+
+class StageTimers:
+    def __init__(self):
+        """
+        Initialize the per-stage wall-clock timers.
+
+        The timers cost a single attribute check while they are disabled, so they can stay in the probe
+        path. They are enabled for the duration of a profile capture, or permanently with `enabled`.
+        """
+        self.enabled = False
+
+    def start(self):
+        """
+        Start timing a stage.
+
+        Returns:
+            float: The start time to pass to `stop`, or None if the timers are disabled.
+        """
+        return time.perf_counter() if self.enabled else None
+
+    def stop(self, stage, started):
+        """
+        Record the time spent in a stage since `start`.
+
+        Args:
+            stage (str): The name of the stage.
+            started (float): The value returned by `start`.
+        """
+        if started is not None:
+            STAGE_SECONDS.observe(time.perf_counter() - started, stage)
+
+    def record(self, stage, seconds):
+        """
+        Record the time spent in a stage that was measured elsewhere.
+
+        Args:
+            stage (str): The name of the stage.
+            seconds (float): The time spent.
+        """
+        if self.enabled:
+            STAGE_SECONDS.observe(seconds, stage)
+
+
+stage_timers = StageTimers()
+
+
+class SamplingProfiler:
+    def __init__(self, interval=0.005):
+        """
+        Initialize a wall-clock sampling profiler of all threads.
+
+        The stack of every thread is sampled from a background thread, so the profiled code runs
+        unmodified and threads waiting on the network or a lock show up as well. The samples are
+        written as collapsed stacks, the input format of flamegraph.pl, speedscope and inferno.
+
+        Args:
+            interval (float): The number of seconds between two samples.
+        """
+        self.interval = interval
+
+    @staticmethod
+    def _frame_name(frame):
+        code = frame.f_code
+        return f'{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})'
+
+    def sample(self, stacks, own_thread):
+        """
+        Add the current stack of every other thread to the counts.
+
+        Args:
+            stacks (dict): Collapsed stack -> number of samples.
+            own_thread (int): The ident of the sampling thread, which is left out.
+        """
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        for ident, frame in sys._current_frames().items():
+            if ident == own_thread:
+                continue
+
+            frames = []
+            while frame is not None:
+                frames.append(self._frame_name(frame))
+                frame = frame.f_back
+            frames.append(names.get(ident, str(ident)))
+
+            stack = ';'.join(reversed(frames))
+            stacks[stack] = stacks.get(stack, 0) + 1
+
+    def run(self, seconds):
+        """
+        Sample all threads for a number of seconds.
+
+        Args:
+            seconds (float): The duration of the profile.
+
+        Returns:
+            dict: Collapsed stack -> number of samples.
+        """
+        stacks = {}
+        own_thread = threading.get_ident()
+        deadline = time.monotonic() + seconds
+        while time.monotonic() < deadline:
+            self.sample(stacks, own_thread)
+            time.sleep(self.interval)
+
+        return stacks
+
+
+_capture_lock = threading.Lock()
+
+
+def capture(seconds=30.0, directory='.', interval=0.005):
+    """
+    Capture a sampling profile and the stage timers of the running process.
+
+    Writes `profile-<pid>-<time>.folded` with the collapsed stacks, for example for
+    `flamegraph.pl profile.folded > profile.svg`, and `profile-<pid>-<time>.stages.txt` with the
+    number of calls and the time spent per stage during the capture.
+
+    Args:
+        seconds (float): The duration of the capture.
+        directory (str): The directory the files are written to.
+        interval (float): The number of seconds between two samples.
+
+    Returns:
+        str: The path of the collapsed stacks file, or None if a capture was already running.
+    """
+    if not _capture_lock.acquire(blocking=False):
+        logging.warning("A profile is already being captured")
+        return None
+
+    try:
+        logging.info("Capturing a %.0f second profile", seconds)
+        enabled = stage_timers.enabled
+        stage_timers.enabled = True
+        before = STAGE_SECONDS.collect()
+        try:
+            stacks = SamplingProfiler(interval).run(seconds)
+        finally:
+            stage_timers.enabled = enabled
+        after = STAGE_SECONDS.collect()
+
+        root = os.path.join(directory, f"profile-{os.getpid()}-{time.strftime('%Y%m%d-%H%M%S')}")
+        with open(f'{root}.folded', 'w', encoding='utf-8') as fh:
+            fh.writelines(f'{stack} {count}\n' for stack, count in sorted(stacks.items()))
+
+        lines = [f"{'stage':<12}{'calls':>10}{'total s':>12}{'mean ms':>10}"]
+        for (stage,), state in sorted(after.items()):
+            previous = before.get((stage,), [0] * len(state))
+            calls = sum(state[:-1]) - sum(previous[:-1])
+            total = state[-1] - previous[-1]
+            if calls:
+                lines.append(f'{stage:<12}{calls:>10}{total:>12.3f}{1000 * total / calls:>10.3f}')
+        with open(f'{root}.stages.txt', 'w', encoding='utf-8') as fh:
+            fh.write('\n'.join(lines) + '\n')
+
+        logging.info("Wrote the profile to %s.folded and the stage timers to %s.stages.txt\n%s", root, root, '\n'.join(lines))
+
+        return f'{root}.folded'
+    finally:
+        _capture_lock.release()
+
+
+def start_capture(seconds=30.0, directory='.', interval=0.005):
+    """
+    Capture a profile from a background thread.
+
+    Args:
+        seconds (float): The duration of the capture.
+        directory (str): The directory the files are written to.
+        interval (float): The number of seconds between two samples.
+    """
+    threading.Thread(target=capture, args=(seconds, directory, interval), name='profiler', daemon=True).start()
+
+
+def install_signal_handler(seconds=30.0, directory='.'):
+    """
+    Capture a profile whenever the process receives SIGUSR1, for example with `kill -USR1 <pid>`.
+
+    Must be called from the main thread. Does nothing on platforms without SIGUSR1.
+
+    Args:
+        seconds (float): The duration of every capture.
+        directory (str): The directory the files are written to.
+    """
+    if not hasattr(signal, 'SIGUSR1'):
+        return
+
+    signal.signal(signal.SIGUSR1, lambda signum, frame: start_capture(seconds, directory))
+    logging.info("Send SIGUSR1 to process %s to capture a %.0f second profile", os.getpid(), seconds)
@@ -1,12 +1,50 @@
+import logging
+import random
+import threading
+import time
+
 from curl_cffi import requests
 
+from metrics import proxy_label
+
 
 class ProxyManager:
-    def __init__(self):
+    def __init__(self, proxies=None, quarantine_threshold=5, base_backoff=5.0, max_backoff=300.0, smoothing=0.2, probe_interval=5.0):
+        """
+        Initialize the proxy manager.
+
+        Every proxy keeps an EWMA of its latency and of its 429, timeout and 5xx rates. Proxies are
+        picked by comparing two random healthy proxies and taking the better one, and proxies that
+        keep failing are quarantined with an exponential backoff until a background probe succeeds.
+
+        Args:
+            proxies (list): The proxies to manage, loaded from the proxy sources when None.
+            quarantine_threshold (int): The number of consecutive failures that quarantine a proxy.
+            base_backoff (float): The number of seconds of the first quarantine of a proxy.
+            max_backoff (float): The maximum number of seconds a proxy is quarantined for.
+            smoothing (float): The EWMA weight of a new latency or error sample.
+            probe_interval (float): The number of seconds between two background probe rounds.
+        """
         self.proxies = []
-        self.current_index = 0
 
-        self.load_proxies()
+        self.quarantine_threshold = quarantine_threshold
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        self.smoothing = smoothing
+        self.probe_interval = probe_interval
+        self.probe_url = 'https://www.vinted.co.uk/robots.txt'
+
+        self.lock = threading.Lock()
+        self.health = {}
+        self._active_index = {}  # Proxy key -> position in self.proxies
+        self._quarantined = {}  # Proxy key -> proxy
+        self._probe_thread = None
+
+        if proxies is None:
+            self.load_proxies()
+        else:
+            for proxy in proxies:
+                self.add_proxy(proxy)
 
     def load_proxies(self):
         proxy_source = [
@@ -21,7 +59,7 @@ class ProxyManager:
                 for proxy_response in response_json:
                     ip_port, username, password = proxy_response.split(';')
 
-                    self.proxies.append({
+                    self.add_proxy({
                         'http': f'http://{username}:{password}@{ip_port}',
                         'https': f'http://{username}:{password}@{ip_port}'
                     })
@@ -30,18 +68,233 @@ class ProxyManager:
             else:
                 print(f"Failed to load proxies from {source}")
 
-    def get_proxy(self):
-        if not self.proxies:
-            raise ValueError("Proxy list is empty.")
+    @staticmethod
+    def proxy_key(proxy):
+        """
+        Get the key a proxy is tracked under.
+
+        Args:
+            proxy (dict): The proxy as returned by get_proxy, or None for direct requests.
+
+        Returns:
+            str: The proxy URL, or None for direct requests.
+        """
+        if isinstance(proxy, dict):
+            return proxy.get('https') or proxy.get('http')
+
+        return proxy
+
+    def add_proxy(self, proxy):
+        """
+        Add a proxy to the active pool.
+
+        Args:
+            proxy (dict): The proxy to add.
+        """
+        key = self.proxy_key(proxy)
+
+        with self.lock:
+            if key in self._active_index or key in self._quarantined:
+                return
+
+            self.health[key] = {
+                'latency': None,
+                'rate_limited': 0.0,
+                'timeouts': 0.0,
+                'server_errors': 0.0,
+                'requests': 0,
+                'consecutive_failures': 0,
+                'last_failure': None,
+                'quarantined_until': None,
+                'backoff': self.base_backoff,
+            }
+            self._activate(proxy)
+
+    def _activate(self, proxy):
+        self._active_index[self.proxy_key(proxy)] = len(self.proxies)
+        self.proxies.append(proxy)
+
+    def _deactivate(self, proxy):
+        # Swap the last proxy into the freed slot so removal stays O(1)
+        index = self._active_index.pop(self.proxy_key(proxy))
+        last = self.proxies.pop()
+        if index < len(self.proxies):
+            self.proxies[index] = last
+            self._active_index[self.proxy_key(last)] = index
+
+    def _score(self, key):
+        health = self.health[key]
+        latency = health['latency'] if health['latency'] is not None else 1.0
+        errors = health['rate_limited'] + health['timeouts'] + health['server_errors']
+
+        return max(0.0, 1.0 - errors) / latency
+
+    def get_proxy(self, exclude=None):
+        """
+        Pick an active proxy.
+
+        Args:
+            exclude (set): The keys of proxies that must not be picked, for example the ones a request already failed through.
+
+        Returns:
+            dict: The proxy, or None if every active proxy is excluded.
+        """
+        with self.lock:
+            if not self.proxies:
+                raise ValueError("Proxy list is empty.")
+
+            candidates = self.proxies
+            if exclude:
+                candidates = [proxy for proxy in self.proxies if self.proxy_key(proxy) not in exclude]
+                if not candidates:
+                    return None
+
+            if len(candidates) == 1:
+                return candidates[0]
+
+            # Power of two choices: O(1) and strongly biased towards healthy, fast proxies
+            first, second = random.sample(candidates, 2)
+            if self._score(self.proxy_key(second)) > self._score(self.proxy_key(first)):
+                return second
+
+            return first
+
+    def report(self, proxy, latency=None, status_code=None, error=None):
+        """
+        Record the outcome of a request sent through a proxy.
+
+        Args:
+            proxy (dict): The proxy the request was sent through.
+            latency (float): The number of seconds the request took.
+            status_code (int): The HTTP status code of the response, if there was one.
+            error (Exception): The exception the request raised, if any.
+
+        Returns:
+            bool: True if this outcome got the proxy quarantined.
+        """
+        key = self.proxy_key(proxy)
+        alpha = self.smoothing
+
+        with self.lock:
+            health = self.health.get(key)
+            if health is None:
+                return False
+
+            health['requests'] += 1
+            if latency is not None and error is None:
+                health['latency'] = latency if health['latency'] is None else health['latency'] + alpha * (latency - health['latency'])
+
+            rate_limited = status_code == 429
+            server_error = status_code is not None and status_code >= 500
+            timeout = error is not None and self.is_timeout(error)
+            health['rate_limited'] += alpha * (rate_limited - health['rate_limited'])
+            health['server_errors'] += alpha * (server_error - health['server_errors'])
+            health['timeouts'] += alpha * (timeout - health['timeouts'])
+
+            if error is not None or rate_limited or server_error:
+                health['consecutive_failures'] += 1
+                health['last_failure'] = time.time()
+                if health['consecutive_failures'] >= self.quarantine_threshold and key in self._active_index:
+                    return self._quarantine(proxy)
+            else:
+                health['consecutive_failures'] = 0
+                health['backoff'] = self.base_backoff
+
+        return False
+
+    @staticmethod
+    def is_timeout(error):
+        """
+        Check whether a request exception is a timeout.
+
+        Args:
+            error (Exception): The exception raised by the request.
+
+        Returns:
+            bool: True if the request timed out.
+        """
+        # curl error 28 is CURLE_OPERATION_TIMEDOUT
+        return isinstance(error, TimeoutError) or getattr(error, 'code', None) == 28 or 'timed out' in str(error).lower()
+
+    def _quarantine(self, proxy):
+        key = self.proxy_key(proxy)
+        health = self.health[key]
+
+        if len(self.proxies) <= 1:
+            # Never quarantine the last proxy, a slow proxy beats no proxy
+            return False
+
+        self._deactivate(proxy)
+        self._quarantined[key] = proxy
+        health['quarantined_until'] = time.time() + health['backoff']
+        logging.warning("Quarantined proxy %s for %.0f seconds", proxy_label(key), health['backoff'])
+        health['backoff'] = min(self.max_backoff, health['backoff'] * 2)
+
+        return True
+
+    def _reinstate(self, proxy):
+        key = self.proxy_key(proxy)
+        health = self.health[key]
+
+        self._quarantined.pop(key, None)
+        self._activate(proxy)
+        health['quarantined_until'] = None
+        health['consecutive_failures'] = 0
+        health['rate_limited'] = health['timeouts'] = health['server_errors'] = 0.0
+        logging.info("Reinstated proxy %s", proxy_label(key))
+
+    def probe_quarantined(self):
+        """
+        Probe every quarantined proxy whose backoff expired and reinstate the ones that respond.
+        """
+        now = time.time()
+        with self.lock:
+            due = [proxy for key, proxy in self._quarantined.items() if self.health[key]['quarantined_until'] <= now]
+
+        for proxy in due:
+            started = time.time()
+            try:
+                response = requests.get(self.probe_url, impersonate='chrome', proxies=proxy, timeout=5)
+                healthy = response.status_code < 400
+            except Exception:
+                healthy = False
+
+            with self.lock:
+                key = self.proxy_key(proxy)
+                if key not in self._quarantined:
+                    continue
+
+                if healthy:
+                    self.health[key]['latency'] = time.time() - started
+                    self._reinstate(proxy)
+                else:
+                    health = self.health[key]
+                    health['quarantined_until'] = time.time() + health['backoff']
+                    health['backoff'] = min(self.max_backoff, health['backoff'] * 2)
+
+    def start_health_checks(self):
+        """
+        Start the background thread that re-probes quarantined proxies.
+        """
+        if self._probe_thread is not None:
+            return
 
-        current_proxy = self.proxies[self.current_index]
-        self.current_index = (self.current_index + 1) % len(self.proxies)
+        def run():
+            while True:
+                time.sleep(self.probe_interval)
+                try:
+                    self.probe_quarantined()
+                except Exception as e:
+                    logging.error("Proxy health check failed: %s", e)
 
-        return current_proxy
+        self._probe_thread = threading.Thread(target=run, name='proxy-health', daemon=True)
+        self._probe_thread.start()
 
     def disable_proxy(self, proxy):
-        if proxy in self.proxies:
-            self.proxies.remove(proxy)
+        key = self.proxy_key(proxy)
 
-            if self.current_index >= len(self.proxies):
-                self.current_index = 0
+        with self.lock:
+            if key in self._active_index:
+                self._deactivate(proxy)
+            self._quarantined.pop(key, None)
+            self.health.pop(key, None)
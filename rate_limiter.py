@@ -0,0 +1,155 @@
+import asyncio
+import threading
+import time
+
+from proxy_manager import ProxyManager
+
+
+class ProxyRateLimiter:
+    def __init__(self, initial_rate=5.0, min_rate=0.2, max_rate=50.0, burst=5, increase=0.05, decrease=0.5):
+        """
+        Initialize a GCRA rate limiter with one learned rate per proxy.
+
+        Every proxy starts at `initial_rate` requests per second. Successful responses raise the
+        rate additively and 429 responses cut it multiplicatively, so each proxy converges just
+        below the rate at which Vinted starts throttling it.
+
+        Args:
+            initial_rate (float): The starting number of requests per second for a proxy.
+            min_rate (float): The lowest number of requests per second a proxy is slowed down to.
+            max_rate (float): The highest number of requests per second a proxy is allowed.
+            burst (int): The number of requests a proxy may send back-to-back.
+            increase (float): The requests per second added after a successful response.
+            decrease (float): The factor the rate is multiplied by after a 429 response.
+        """
+        self.initial_rate = initial_rate
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.burst = burst
+        self.increase = increase
+        self.decrease = decrease
+
+        self.lock = threading.Lock()
+        self.buckets = {}
+
+    def _bucket(self, proxy):
+        key = ProxyManager.proxy_key(proxy)
+        bucket = self.buckets.get(key)
+        if bucket is None:
+            bucket = self.buckets[key] = {'rate': self.initial_rate, 'tat': 0.0, 'requests': 0, 'rate_limited': 0}
+
+        return bucket
+
+    def reserve(self, proxy):
+        """
+        Reserve the next request slot of a proxy.
+
+        Args:
+            proxy (dict): The proxy the request will be sent through.
+
+        Returns:
+            float: The number of seconds to wait before the request may be sent.
+        """
+        now = time.monotonic()
+
+        with self.lock:
+            bucket = self._bucket(proxy)
+            interval = 1.0 / bucket['rate']
+            tat = max(bucket['tat'], now)
+            bucket['tat'] = tat + interval
+
+        return max(0.0, tat - now - (self.burst - 1) * interval)
+
+    def try_reserve(self, proxy):
+        """
+        Reserve the next request slot of a proxy only if the request may be sent right away.
+
+        Args:
+            proxy (dict): The proxy the request will be sent through.
+
+        Returns:
+            bool: True if the slot was reserved.
+        """
+        now = time.monotonic()
+
+        with self.lock:
+            bucket = self._bucket(proxy)
+            interval = 1.0 / bucket['rate']
+            tat = max(bucket['tat'], now)
+            if tat - now - (self.burst - 1) * interval > 0:
+                return False
+            bucket['tat'] = tat + interval
+
+        return True
+
+    def delay(self, proxy):
+        """
+        Get the number of seconds until a proxy may send, without reserving its slot.
+
+        Args:
+            proxy (dict): The proxy the request would be sent through.
+
+        Returns:
+            float: The number of seconds to wait, 0 if the proxy may send right away.
+        """
+        now = time.monotonic()
+
+        with self.lock:
+            bucket = self._bucket(proxy)
+            interval = 1.0 / bucket['rate']
+            return max(0.0, max(bucket['tat'], now) - now - (self.burst - 1) * interval)
+
+    def wait(self, proxy):
+        """
+        Block the calling thread until the proxy has a token available.
+
+        Args:
+            proxy (dict): The proxy the request will be sent through.
+        """
+        delay = self.reserve(proxy)
+        if delay > 0:
+            time.sleep(delay)
+
+    async def wait_async(self, proxy):
+        """
+        Wait on the event loop until the proxy has a token available.
+
+        Args:
+            proxy (dict): The proxy the request will be sent through.
+        """
+        delay = self.reserve(proxy)
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    def record(self, proxy, status_code):
+        """
+        Learn from the response a proxy got.
+
+        Args:
+            proxy (dict): The proxy the request was sent through.
+            status_code (int): The HTTP status code of the response.
+        """
+        with self.lock:
+            bucket = self._bucket(proxy)
+            bucket['requests'] += 1
+
+            if status_code == 429:
+                bucket['rate_limited'] += 1
+                bucket['rate'] = max(self.min_rate, bucket['rate'] * self.decrease)
+                # Let the throttled proxy cool down for one interval at its new rate
+                bucket['tat'] = max(bucket['tat'], time.monotonic() + 1.0 / bucket['rate'])
+            else:
+                bucket['rate'] = min(self.max_rate, bucket['rate'] + self.increase)
+
+    def get_rate(self, proxy):
+        """
+        Get the learned rate of a proxy.
+
+        Args:
+            proxy (dict): The proxy.
+
+        Returns:
+            float: The number of requests per second the proxy is currently allowed.
+        """
+        with self.lock:
+            return self._bucket(proxy)['rate']
@@ -0,0 +1,154 @@
+import heapq
+import threading
+import time
+
+from metrics import REGISTRY
+
+REPROBE_BUCKETS = (0.5, 1, 2, 4, 8, 15, 30)
+
+REPROBES = REGISTRY.counter('vinted_reprobes_total', 'IDs of the re-probe scheduler by event.', ['event'])
+REPROBE_RESOLVED = REGISTRY.histogram(
+    'vinted_reprobe_resolved_seconds', 'Seconds between the first 404 of a scheduled ID and the probe that found it.',
+    buckets=REPROBE_BUCKETS
+)
+
+
+class ReprobeScheduler:
+    def __init__(self, delays=(0.5, 1.0, 2.0, 4.0, 8.0, 15.0), max_age=30.0, max_pending=2000, max_rate=10.0, clock=time.time):
+        """
+        Initialize the scheduler that probes IDs again after they returned 404 near the frontier.
+
+        An ID that is not visible yet when a sweep reaches it is lost once the next sweeps start
+        past it. Scheduled IDs are kept in a heap ordered by their next due time and handed back to
+        the engines `delays[n]` seconds after their n-th probe, until one finds the item or the ID
+        is `max_age` seconds old. Re-probes are paced to `max_rate` per second, and new IDs are
+        refused while `max_pending` IDs are scheduled.
+
+        Args:
+            delays (tuple): The number of seconds before each re-probe of an ID, counted from the previous probe.
+            max_age (float): The number of seconds after its first 404 that an ID is given up on.
+            max_pending (int): The maximum number of scheduled IDs.
+            max_rate (float): The maximum number of re-probes per second.
+            clock (callable): The function returning the current epoch.
+        """
+        self.delays = delays
+        self.max_age = max_age
+        self.max_pending = max_pending
+        self.max_rate = max_rate
+        self.clock = clock
+
+        self.lock = threading.Lock()
+        self.heap = []  # (due epoch, item ID)
+        self.pending = {}  # Item ID -> [epoch of the first 404, number of re-probes handed out]
+        self._tokens = max_rate
+        self._refilled = None
+
+    def __len__(self):
+        return len(self.pending)
+
+    def __contains__(self, item_id):
+        return item_id in self.pending
+
+    def schedule(self, item_id):
+        """
+        Schedule an ID that returned 404. IDs that are already scheduled keep their schedule.
+
+        Args:
+            item_id (int): The ID of the missing item.
+
+        Returns:
+            bool: True if the ID was newly scheduled.
+        """
+        item_id = int(item_id)
+        if item_id in self.pending:
+            return False
+
+        now = self.clock()
+        with self.lock:
+            if item_id in self.pending:
+                return False
+            if len(self.pending) >= self.max_pending:
+                REPROBES.inc('refused')
+                return False
+
+            self.pending[item_id] = [now, 0]
+            heapq.heappush(self.heap, (now + self.delays[0], item_id))
+
+        REPROBES.inc('scheduled')
+        return True
+
+    def resolve(self, item_id):
+        """
+        Stop re-probing an ID whose item was found.
+
+        Args:
+            item_id (int): The ID of the found item.
+        """
+        item_id = int(item_id)
+        if item_id not in self.pending:
+            return
+
+        with self.lock:
+            entry = self.pending.pop(item_id, None)
+        if entry is None:
+            return
+
+        # The heap entry is skipped once it comes due
+        REPROBES.inc('resolved')
+        REPROBE_RESOLVED.observe(self.clock() - entry[0])
+
+    def pop_due(self):
+        """
+        Take the next ID that is due for a re-probe, if the re-probe rate allows one.
+
+        The next re-probe of the ID is scheduled right away, so an ID whose probe is lost or
+        skipped is still retried until it resolves or ages out. After its last re-probe an ID
+        stays scheduled until it is `max_age` seconds old, so that probe can still resolve it.
+
+        Returns:
+            int: The ID to probe, or None if no ID is due.
+        """
+        heap = self.heap
+        if not heap:
+            return None
+
+        now = self.clock()
+        if heap[0][0] > now:
+            return None
+
+        with self.lock:
+            if self._refilled is None:
+                self._refilled = now
+            self._tokens = min(self.max_rate, self._tokens + (now - self._refilled) * self.max_rate)
+            self._refilled = now
+
+            while heap and heap[0][0] <= now:
+                due, item_id = heapq.heappop(heap)
+                entry = self.pending.get(item_id)
+                if entry is None:
+                    continue
+
+                first, attempt = entry
+                if attempt >= len(self.delays):
+                    # The last re-probe had its chance to find the item
+                    del self.pending[item_id]
+                    REPROBES.inc('expired')
+                    continue
+
+                if self._tokens < 1.0:
+                    heapq.heappush(heap, (due, item_id))
+                    return None
+
+                attempt += 1
+                if attempt < len(self.delays) and now + self.delays[attempt] <= first + self.max_age:
+                    heapq.heappush(heap, (now + self.delays[attempt], item_id))
+                else:
+                    attempt = len(self.delays)
+                    heapq.heappush(heap, (max(now + self.delays[0], first + self.max_age), item_id))
+                entry[1] = attempt
+
+                self._tokens -= 1.0
+                REPROBES.inc('reprobed')
+                return item_id
+
+        return None
@@ -0,0 +1,570 @@
+import asyncio
+import collections
+import concurrent.futures
+import random
+import threading
+import time
+
+from metrics import REGISTRY
+from proxy_manager import ProxyManager
+
+RETRIES = REGISTRY.counter('vinted_retries_total', 'Requests retried on another proxy, by endpoint and failure.', ['endpoint', 'failure'])
+RETRIES_DENIED = REGISTRY.counter(
+    'vinted_retries_denied_total', 'Retryable failures that were not retried because the retry budget was spent.', ['endpoint']
+)
+HEDGES = REGISTRY.counter(
+    'vinted_hedges_total', 'Hot zone probes that outlived the hedge deadline, by what happened to the duplicate.', ['outcome']
+)
+HOT_PROBE_LATENCY = REGISTRY.histogram(
+    'vinted_hot_probe_seconds',
+    'Latency of the hot zone probes with hedging, and of their first request alone as it would have been without.', ['path']
+)
+
+
+def classify(status_code=None, error=None):
+    """
+    Classify the outcome of a request.
+
+    Args:
+        status_code (int): The HTTP status code of the response, if there was one.
+        error (Exception): The exception the request raised, if any.
+
+    Returns:
+        str: 'ok', 'not_found', 'rate_limited', 'unauthorized', 'server_error', 'client_error', 'timeout' or 'proxy'.
+    """
+    if error is not None:
+        return 'timeout' if ProxyManager.is_timeout(error) else 'proxy'
+    if status_code == 404:
+        return 'not_found'
+    if status_code == 429:
+        return 'rate_limited'
+    if status_code == 401:
+        return 'unauthorized'
+    if status_code >= 500:
+        return 'server_error'
+    if status_code >= 400:
+        return 'client_error'
+
+    return 'ok'
+
+
+class RetryBudget:
+    def __init__(self, ratio=0.1, minimum=10):
+        """
+        Initialize a retry budget that is refilled at the start of every cycle.
+
+        A cycle may retry `minimum` requests plus `ratio` of the requests sent in it, so retries
+        stay a bounded share of the traffic when a large part of the proxies is failing.
+
+        Args:
+            ratio (float): The retries earned per request sent in the cycle.
+            minimum (int): The retries every cycle may spend regardless of its traffic.
+        """
+        self.ratio = ratio
+        self.minimum = minimum
+
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.retries = 0
+
+    def reset(self):
+        """
+        Start a new cycle.
+        """
+        with self.lock:
+            self.requests = 0
+            self.retries = 0
+
+    def record_request(self):
+        with self.lock:
+            self.requests += 1
+
+    def acquire(self):
+        """
+        Spend one retry of the budget.
+
+        Returns:
+            bool: True if the retry may be sent.
+        """
+        with self.lock:
+            if self.retries >= self.minimum + self.ratio * self.requests:
+                return False
+
+            self.retries += 1
+            return True
+
+
+class LatencyTracker:
+    def __init__(self, size=1000, quantile=0.9, refresh=100, min_samples=50):
+        """
+        Initialize a running estimate of a latency quantile over the most recent requests.
+
+        Args:
+            size (int): The number of recent latencies the quantile is computed over.
+            quantile (float): The quantile to estimate.
+            refresh (int): The number of new latencies after which the quantile is recomputed.
+            min_samples (int): The number of latencies needed before there is an estimate.
+        """
+        self.quantile = quantile
+        self.refresh = refresh
+        self.min_samples = min_samples
+
+        self.samples = collections.deque(maxlen=size)
+        self.value = None
+        self._pending = 0
+
+    def add(self, latency):
+        """
+        Record the latency of a request.
+
+        Args:
+            latency (float): The number of seconds the request took.
+        """
+        self.samples.append(latency)
+        self._pending += 1
+        if self._pending >= self.refresh and len(self.samples) >= self.min_samples:
+            self._pending = 0
+            samples = sorted(self.samples)
+            self.value = samples[min(len(samples) - 1, int(self.quantile * len(samples)))]
+
+
+class RetryPolicy:
+    def __init__(self, attempts=2, retry_on=('rate_limited', 'unauthorized', 'server_error', 'timeout', 'proxy'),
+                 budget=None):
+        """
+        Initialize the retry policy of an endpoint.
+
+        Args:
+            attempts (int): The maximum number of attempts of a request, each through a different proxy.
+            retry_on (tuple): The failures, as returned by `classify`, that are retried.
+            budget (RetryBudget): The retry budget of the endpoint, a new RetryBudget when None.
+        """
+        self.attempts = attempts
+        self.retry_on = frozenset(retry_on)
+        self.budget = budget if budget is not None else RetryBudget()
+
+
+class RequestExecutor:
+    # Failures that say something about the proxy rather than the cookie or the requested item
+    BACKOFF_ON = frozenset(('rate_limited', 'server_error', 'timeout', 'proxy'))
+
+    def __init__(self, vinted, headers=None, policies=None, base_delay=0.25, max_delay=30.0, hedge_budget=None,
+                 hedge_threads=64):
+        """
+        Initialize the layer every API request of the scanner is sent through.
+
+        A failed attempt is retried at once through a different proxy, never after a sleep. The
+        proxy that failed is benched for a decorrelated jitter delay instead, which grows while the
+        proxy keeps failing and is reset by its next success, and other requests avoid it until the
+        delay is over. Retries are capped by the budget of their endpoint's policy.
+
+        Requests sent with `hedge` get a duplicate through another proxy once they are slower than
+        the p90 latency of their endpoint, and the first usable answer wins. Hedges are capped by
+        `hedge_budget`.
+
+        Args:
+            vinted (Vinted): The Vinted instance whose proxies, cookies and rate limiter are used.
+            headers (dict): The headers sent with every request.
+            policies (dict): Endpoint -> RetryPolicy, the default policies when None.
+            base_delay (float): The number of seconds a failing proxy is benched for at least.
+            max_delay (float): The number of seconds a failing proxy is benched for at most.
+            hedge_budget (RetryBudget): The budget of the duplicates of hedged requests, 10% of them when None.
+            hedge_threads (int): The number of threads that send the hedged requests of the threaded engine.
+        """
+        self.vinted = vinted
+        self.headers = headers
+        self.policies = policies if policies is not None else {
+            'item': RetryPolicy(attempts=2, budget=RetryBudget(ratio=0.1, minimum=10)),
+            'catalog': RetryPolicy(attempts=3, budget=RetryBudget(ratio=0.5, minimum=10)),
+        }
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.hedge_budget = hedge_budget if hedge_budget is not None else RetryBudget(ratio=0.1, minimum=5)
+        self.hedge_threads = hedge_threads
+        self.latency = {endpoint: LatencyTracker() for endpoint in self.policies}
+
+        self.lock = threading.Lock()
+        self.backoff = {}  # Proxy key -> [last delay, monotonic time the proxy may be used again]
+        self._hedge_pool = None
+        self._background = set()  # Hedged attempts of the async engine that lost but are still running
+
+    def new_cycle(self):
+        """
+        Refill the retry and hedge budgets, at the start of every sweep.
+        """
+        for policy in self.policies.values():
+            policy.budget.reset()
+        self.hedge_budget.reset()
+
+    def _benched(self, now):
+        if not self.backoff:
+            return set()
+
+        with self.lock:
+            return {key for key, (_, until) in self.backoff.items() if until > now}
+
+    def _bench(self, proxy):
+        # Decorrelated jitter: the next delay is drawn between the base delay and three times the last one
+        key = ProxyManager.proxy_key(proxy)
+        with self.lock:
+            delay, _ = self.backoff.get(key, (self.base_delay, 0.0))
+            delay = min(self.max_delay, random.uniform(self.base_delay, delay * 3))
+            self.backoff[key] = [delay, time.monotonic() + delay]
+
+    def _release(self, proxy):
+        key = ProxyManager.proxy_key(proxy)
+        if key in self.backoff:
+            with self.lock:
+                self.backoff.pop(key, None)
+
+    def _pick_proxy(self, tried):
+        """
+        Pick the proxy of the next attempt.
+
+        Args:
+            tried (set): The keys of the proxies the request was already sent through.
+
+        Returns:
+            dict: A proxy that was not tried and is not benched, or None if a retry has no proxy left.
+        """
+        proxy_manager = self.vinted.proxy_manager
+        proxy = proxy_manager.get_proxy(exclude=tried | self._benched(time.monotonic()))
+        if proxy is None and not tried:
+            # A first attempt is always sent, through a benched proxy if all of them are
+            proxy = proxy_manager.get_proxy()
+
+        return proxy
+
+    def _record(self, endpoint, proxy, started, cookies, data=None, error=None):
+        """
+        Feed the outcome of an attempt back into the proxy health, the cookie pool and the bench.
+
+        Returns:
+            str: The outcome as returned by `classify`.
+        """
+        status_code = data.status_code if data is not None else None
+        self.vinted._record_proxy_result(proxy, started, status_code=status_code, error=error, cookies=cookies)
+
+        outcome = classify(status_code, error)
+        if outcome in self.BACKOFF_ON:
+            self._bench(proxy)
+        else:
+            if error is None:
+                self.latency[endpoint].add(time.time() - started)
+            if outcome != 'unauthorized':
+                self._release(proxy)
+
+        return outcome
+
+    def _attempt(self, endpoint, proxy, url, timeout, paced=True, headers=None):
+        """
+        Send one attempt through a proxy from a worker thread.
+
+        Args:
+            paced (bool): Wait for the rate limiter first, False if the slot was already reserved.
+            headers (dict): Headers sent on top of the common headers.
+
+        Returns:
+            tuple: (response, error, outcome), the response or the error is None.
+        """
+        vinted = self.vinted
+        cookies = vinted.cookie_pool.cookies(proxy)
+        if paced:
+            vinted.rate_limiter.wait(proxy)
+        started = time.time()
+        try:
+            with vinted.session_pool.session(proxy) as session:
+                data = session.get(
+                    url=url,
+                    headers={**self.headers, **headers} if headers else self.headers,
+                    cookies=cookies,
+                    proxies=proxy,
+                    timeout=timeout,
+                    impersonate='chrome'
+                )
+        except Exception as e:
+            return None, e, self._record(endpoint, proxy, started, cookies, error=e)
+
+        return data, None, self._record(endpoint, proxy, started, cookies, data=data)
+
+    async def _attempt_async(self, session, endpoint, proxy, url, timeout, paced=True):
+        """
+        Send one attempt through a proxy from the event loop.
+
+        Args:
+            paced (bool): Wait for the rate limiter first, False if the slot was already reserved.
+
+        Returns:
+            tuple: (response, error, outcome), the response or the error is None.
+        """
+        vinted = self.vinted
+        cookies = vinted.cookie_pool.cookies(proxy)
+        if paced:
+            await vinted.rate_limiter.wait_async(proxy)
+        started = time.time()
+        try:
+            data = await session.get(
+                url=url,
+                headers=self.headers,
+                cookies=cookies,
+                proxies=proxy,
+                timeout=timeout,
+                impersonate='chrome'
+            )
+        except Exception as e:
+            return None, e, self._record(endpoint, proxy, started, cookies, error=e)
+
+        return data, None, self._record(endpoint, proxy, started, cookies, data=data)
+
+    def _hedge_proxy(self, endpoint, proxy, tried):
+        """
+        Decide whether a slow first attempt gets a duplicate and pick its proxy.
+
+        A duplicate that has to queue behind the rate limiter would not answer sooner, so only
+        proxies that may send right away are considered, and their slot is reserved.
+
+        Returns:
+            dict: The proxy of the duplicate, or None if the request is not hedged.
+        """
+        if not self.hedge_budget.acquire():
+            HEDGES.inc('denied')
+            return None
+
+        exclude = tried | {ProxyManager.proxy_key(proxy)}
+        for _ in range(3):
+            hedge_proxy = self.vinted.proxy_manager.get_proxy(exclude=exclude | self._benched(time.monotonic()))
+            if hedge_proxy is None:
+                break
+
+            if self.vinted.rate_limiter.try_reserve(hedge_proxy):
+                HEDGES.inc('sent')
+                tried.add(ProxyManager.proxy_key(hedge_proxy))
+                return hedge_proxy
+            exclude.add(ProxyManager.proxy_key(hedge_proxy))
+
+        HEDGES.inc('no_proxy')
+        return None
+
+    def _winner(self, policy, results):
+        # The first usable answer wins, a failure only if both attempts failed
+        for result in results:
+            if result[2] not in policy.retry_on:
+                return result
+
+        return None
+
+    def _hedged_attempt(self, endpoint, policy, proxy, tried, url, timeout):
+        """
+        Send the first attempt of a hedged request from a worker thread.
+
+        Both attempts run on the hedge pool, so the worker can give up waiting on the first one
+        at the deadline, which starts once the rate limiter lets the first attempt out. The attempt
+        that loses runs to completion in the background.
+
+        Returns:
+            tuple: (proxy, response, error, outcome) of the attempt that answered.
+        """
+        deadline = self.latency[endpoint].value
+        if deadline is None:
+            return (proxy, *self._attempt(endpoint, proxy, url, timeout))
+
+        if self._hedge_pool is None:
+            with self.lock:
+                if self._hedge_pool is None:
+                    self._hedge_pool = concurrent.futures.ThreadPoolExecutor(max_workers=self.hedge_threads, thread_name_prefix='hedge')
+
+        self.vinted.rate_limiter.wait(proxy)
+        started = time.monotonic()
+        first = self._hedge_pool.submit(self._attempt, endpoint, proxy, url, timeout, False)
+        first.add_done_callback(lambda future: HOT_PROBE_LATENCY.observe(time.monotonic() - started, 'unhedged'))
+        done, _ = concurrent.futures.wait([first], timeout=deadline)
+        hedge_proxy = None if done else self._hedge_proxy(endpoint, proxy, tried)
+        if hedge_proxy is None:
+            result = (proxy, *first.result())
+        else:
+            second = self._hedge_pool.submit(self._attempt, endpoint, hedge_proxy, url, timeout, False)
+            proxies = {first: proxy, second: hedge_proxy}
+            results = []
+            for future in concurrent.futures.as_completed(proxies):
+                results.append((proxies[future], *future.result()))
+                result = self._winner(policy, results)
+                if result is not None:
+                    break
+            else:
+                result = results[-1]
+            HEDGES.inc('won' if result[0] is hedge_proxy else 'lost')
+
+        HOT_PROBE_LATENCY.observe(time.monotonic() - started, 'hedged')
+        return result
+
+    async def _hedged_attempt_async(self, session, endpoint, policy, proxy, tried, url, timeout, paced=True):
+        """
+        Send the first attempt of a hedged request from the event loop.
+
+        Returns:
+            tuple: (proxy, response, error, outcome) of the attempt that answered.
+        """
+        deadline = self.latency[endpoint].value
+        if deadline is None:
+            return (proxy, *await self._attempt_async(session, endpoint, proxy, url, timeout, paced))
+
+        if paced:
+            await self.vinted.rate_limiter.wait_async(proxy)
+        started = time.monotonic()
+        first = asyncio.ensure_future(self._attempt_async(session, endpoint, proxy, url, timeout, False))
+        first.add_done_callback(lambda task: HOT_PROBE_LATENCY.observe(time.monotonic() - started, 'unhedged'))
+        done, _ = await asyncio.wait({first}, timeout=deadline)
+        hedge_proxy = None if done else self._hedge_proxy(endpoint, proxy, tried)
+        if hedge_proxy is None:
+            result = (proxy, *await first)
+        else:
+            second = asyncio.ensure_future(self._attempt_async(session, endpoint, hedge_proxy, url, timeout, False))
+            proxies = {first: proxy, second: hedge_proxy}
+            pending = set(proxies)
+            results = []
+            result = None
+            while pending and result is None:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                results.extend((proxies[task], *task.result()) for task in done)
+                result = self._winner(policy, results)
+            if result is None:
+                result = results[-1]
+
+            # Keep the loser alive until it finishes, so its outcome still reaches the proxy health
+            for task in pending:
+                self._background.add(task)
+                task.add_done_callback(self._background.discard)
+            HEDGES.inc('won' if result[0] is hedge_proxy else 'lost')
+
+        HOT_PROBE_LATENCY.observe(time.monotonic() - started, 'hedged')
+        return result
+
+    def _retry(self, endpoint, policy, proxy, tried, attempt, outcome):
+        """
+        Decide whether to retry a failed attempt.
+
+        Returns:
+            bool: True if the request is retried.
+        """
+        if outcome not in policy.retry_on or attempt + 1 >= policy.attempts:
+            return False
+        if not policy.budget.acquire():
+            RETRIES_DENIED.inc(endpoint)
+            return False
+
+        tried.add(ProxyManager.proxy_key(proxy))
+        RETRIES.inc(endpoint, outcome)
+        return True
+
+    def get(self, endpoint, url, timeout=None, hedge=False, headers=None):
+        """
+        Send a GET request to the Vinted API from a worker thread.
+
+        Args:
+            endpoint (str): The endpoint whose policy applies, 'item' or 'catalog'.
+            url (str): The requested URL.
+            timeout (float): The number of seconds an attempt may take.
+            hedge (bool): Send a duplicate through another proxy if the first attempt is slow.
+            headers (dict): Headers sent on top of the common headers, for example If-None-Match.
+
+        Returns:
+            Response: The response of the last attempt.
+
+        Raises:
+            Exception: The error of the last attempt, if it raised one.
+        """
+        policy = self.policies[endpoint]
+        policy.budget.record_request()
+        if hedge:
+            self.hedge_budget.record_request()
+        tried = set()
+        data = error = None
+
+        for attempt in range(policy.attempts):
+            proxy = self._pick_proxy(tried)
+            if proxy is None:
+                break
+
+            if hedge and attempt == 0:
+                proxy, data, error, outcome = self._hedged_attempt(endpoint, policy, proxy, tried, url, timeout)
+            else:
+                data, error, outcome = self._attempt(endpoint, proxy, url, timeout, headers=headers)
+
+            if not self._retry(endpoint, policy, proxy, tried, attempt, outcome):
+                break
+
+        # Raise the error of the last attempt, also when no proxy was left for the retry
+        if error is not None:
+            raise error
+
+        return data
+
+    async def reserve_async(self, cancelled=None):
+        """
+        Wait on the event loop until a proxy may send right away and reserve its slot.
+
+        Workers that reserve before they take an ID send it as soon as it is taken, instead of
+        queueing it behind the rate limiter while the frontier moves on.
+
+        Args:
+            cancelled (callable): Stop waiting once it returns True, so no slot is reserved for work that will not come.
+
+        Returns:
+            dict: The proxy, to pass to `get_async` as the proxy of the first attempt, or None if cancelled.
+        """
+        rate_limiter = self.vinted.rate_limiter
+        while True:
+            if cancelled is not None and cancelled():
+                return None
+            proxy = self._pick_proxy(set())
+            if rate_limiter.try_reserve(proxy):
+                return proxy
+            await asyncio.sleep(rate_limiter.delay(proxy))
+
+    async def get_async(self, session, endpoint, url, timeout=None, hedge=False, proxy=None):
+        """
+        Send a GET request to the Vinted API from the event loop.
+
+        Args:
+            session (AsyncSession): The curl_cffi session to send the attempts with.
+            endpoint (str): The endpoint whose policy applies, 'item' or 'catalog'.
+            url (str): The requested URL.
+            timeout (float): The number of seconds an attempt may take.
+            hedge (bool): Send a duplicate through another proxy if the first attempt is slow.
+            proxy (dict): The proxy of the first attempt, as returned by `reserve_async`, picked and paced here when None.
+
+        Returns:
+            Response: The response of the last attempt.
+
+        Raises:
+            Exception: The error of the last attempt, if it raised one.
+        """
+        policy = self.policies[endpoint]
+        policy.budget.record_request()
+        if hedge:
+            self.hedge_budget.record_request()
+        tried = set()
+        data = error = None
+        reserved = proxy
+
+        for attempt in range(policy.attempts):
+            proxy = reserved if attempt == 0 and reserved is not None else self._pick_proxy(tried)
+            if proxy is None:
+                break
+
+            paced = attempt > 0 or reserved is None
+            if hedge and attempt == 0:
+                proxy, data, error, outcome = await self._hedged_attempt_async(
+                    session, endpoint, policy, proxy, tried, url, timeout, paced
+                )
+            else:
+                data, error, outcome = await self._attempt_async(session, endpoint, proxy, url, timeout, paced)
+
+            if not self._retry(endpoint, policy, proxy, tried, attempt, outcome):
+                break
+
+        # Raise the error of the last attempt, also when no proxy was left for the retry
+        if error is not None:
+            raise error
+
+        return data
@@ -0,0 +1,208 @@
+import asyncio
+import threading
+import weakref
+
+from contextlib import contextmanager
+from curl_cffi import requests
+from curl_cffi.requests import AsyncSession
+
+from proxy_manager import ProxyManager
+
+
+class SessionPool:
+    def __init__(self, sessions_per_proxy=4, impersonate='chrome'):
+        """
+        Initialize a pool of long-lived curl_cffi sessions, kept per proxy.
+
+        A session keeps its connections alive, so requests through the same proxy reuse the
+        CONNECT tunnel and TLS session (and HTTP/2 multiplexing where the proxy allows it)
+        instead of paying for a new handshake on every request. Its cookie jar is emptied when it
+        is checked back in, so a request only ever sends the cookies it is given.
+
+        Args:
+            sessions_per_proxy (int): The number of idle sessions kept per proxy.
+            impersonate (str): The browser the sessions impersonate.
+        """
+        self.sessions_per_proxy = sessions_per_proxy
+        self.impersonate = impersonate
+        self.lock = threading.Lock()
+        self.idle = {}  # Proxy key -> idle sessions
+        self.async_sessions = weakref.WeakSet()
+
+    @contextmanager
+    def session(self, proxy=None):
+        """
+        Check out a session for a proxy for the duration of a request.
+
+        A session is only ever used by one worker at a time. When all sessions of a proxy are in
+        use a new one is created, and surplus sessions are closed when they are checked back in.
+
+        Args:
+            proxy (dict): The proxy the requests will be sent through, or None for direct requests.
+
+        Yields:
+            Session: The checked out session.
+        """
+        key = ProxyManager.proxy_key(proxy)
+
+        with self.lock:
+            idle = self.idle.get(key)
+            session = idle.pop() if idle else None
+
+        if session is None:
+            session = requests.Session(impersonate=self.impersonate)
+
+        try:
+            yield session
+        finally:
+            session.cookies.clear()
+            with self.lock:
+                idle = self.idle.setdefault(key, [])
+                if len(idle) < self.sessions_per_proxy:
+                    idle.append(session)
+                    session = None
+
+            if session is not None:
+                session.close()
+
+    def async_session(self, max_clients=10):
+        """
+        Create the asynchronous sessions of the asyncio probing engine, one per proxy.
+
+        Args:
+            max_clients (int): The number of requests each proxy's session keeps in flight at once.
+
+        Returns:
+            AsyncSessions: The sessions, to be closed by the caller.
+        """
+        async_sessions = AsyncSessions(impersonate=self.impersonate, max_clients=max_clients)
+        self.async_sessions.add(async_sessions)
+
+        return async_sessions
+
+    def discard(self, proxy):
+        """
+        Close the idle sessions of a proxy and drop its asynchronous sessions, for example after it was quarantined.
+
+        Args:
+            proxy (dict): The proxy whose sessions are closed.
+        """
+        with self.lock:
+            sessions = self.idle.pop(ProxyManager.proxy_key(proxy), [])
+            async_sessions = list(self.async_sessions)
+
+        for session in sessions:
+            session.close()
+        for session in async_sessions:
+            session.discard(proxy)
+
+    def close(self):
+        """
+        Close every idle session in the pool.
+        """
+        with self.lock:
+            sessions = [session for idle in self.idle.values() for session in idle]
+            self.idle.clear()
+
+        for session in sessions:
+            session.close()
+
+
+class AsyncSessions:
+    def __init__(self, impersonate='chrome', max_clients=10):
+        """
+        Initialize a set of asynchronous sessions that sends every request through the session of its proxy.
+
+        curl_cffi sends the cookies of the session jar along with the cookies of a request and stores
+        every Set-Cookie it receives, so proxies never share a session and the jar is emptied after
+        every response. A request only sends the cookies it is given, which are the cookies of
+        another proxy when the cookie pool holds none for its own.
+
+        Args:
+            impersonate (str): The browser the sessions impersonate.
+            max_clients (int): The number of requests each session keeps in flight at once.
+        """
+        self.impersonate = impersonate
+        self.max_clients = max_clients
+        self.lock = threading.Lock()
+        self.sessions = {}  # Proxy key -> session
+        self.in_flight = {}  # Session -> number of requests in flight
+        self.retired = set()  # Discarded sessions, closed once their last request is done
+        self.loop = None
+
+    def _session(self, proxy):
+        key = ProxyManager.proxy_key(proxy)
+        with self.lock:
+            self.loop = asyncio.get_running_loop()
+            session = self.sessions.get(key)
+            if session is None:
+                session = self.sessions[key] = AsyncSession(impersonate=self.impersonate, max_clients=self.max_clients)
+            self.in_flight[session] = self.in_flight.get(session, 0) + 1
+
+        return session
+
+    def _release(self, session):
+        # True when the session was discarded and this was its last request
+        with self.lock:
+            self.in_flight[session] -= 1
+            if self.in_flight[session]:
+                return False
+
+            del self.in_flight[session]
+            if session not in self.retired:
+                return False
+
+            self.retired.discard(session)
+            return True
+
+    async def get(self, url, proxies=None, **kwargs):
+        """
+        Send a GET request through the session of its proxy.
+
+        Args:
+            url (str): The requested URL.
+            proxies (dict): The proxy to send the request through, or None for a direct request.
+            **kwargs: The other arguments of `AsyncSession.get`.
+
+        Returns:
+            Response: The response.
+        """
+        session = self._session(proxies)
+        try:
+            return await session.get(url, proxies=proxies, **kwargs)
+        finally:
+            session.cookies.clear()
+            if self._release(session):
+                await session.close()
+
+    def discard(self, proxy):
+        """
+        Drop the session of a proxy, for example after it was quarantined. Safe to call from any thread.
+
+        The session is closed once its requests in flight are done, and a later request through the
+        proxy opens a new one.
+
+        Args:
+            proxy (dict): The proxy whose session is dropped.
+        """
+        with self.lock:
+            session = self.sessions.pop(ProxyManager.proxy_key(proxy), None)
+            if session is None:
+                return
+            if session in self.in_flight:
+                self.retired.add(session)
+                return
+            loop = self.loop
+
+        if loop is not None and not loop.is_closed():
+            asyncio.run_coroutine_threadsafe(session.close(), loop)
+
+    async def close(self):
+        """
+        Close the session of every proxy.
+        """
+        with self.lock:
+            sessions = list(self.sessions.values())
+            self.sessions.clear()
+        for session in sessions:
+            await session.close()
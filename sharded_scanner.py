@@ -0,0 +1,248 @@
+import asyncio
+import logging
+import multiprocessing
+import os
+import queue
+import threading
+import time
+
+from id_window import IdWindow
+from main import Vinted
+from metrics import start_metrics_server
+from log_setup import configure_logging
+from profiler import install_signal_handler
+from probe_engine import AsyncProbeEngine
+
+
+def shard_ids(window, shard_index, shard_count):
+    """
+    Select the IDs of a probing window that belong to a shard.
+
+    Args:
+        window (range): The IDs of the full probing window.
+        shard_index (int): The index of the shard.
+        shard_count (int): The total number of shards.
+
+    Returns:
+        range: The IDs in the window for which `item_id % shard_count == shard_index`.
+    """
+    first = window.start + (shard_index - window.start) % shard_count
+
+    return range(first, window.stop, shard_count)
+
+
+async def scan_shard(vinted, shard_index, shard_count, head, reports):
+    """
+    Probe one shard of the ID space of every sweep, following the catalog head published by the supervisor.
+
+    Args:
+        vinted (Vinted): The Vinted instance of this worker process.
+        shard_index (int): The index of the shard this worker owns.
+        shard_count (int): The total number of shards.
+        head (Value): The newest catalog ID, shared with the supervisor.
+        reports (Queue): The queue the sweep statistics are sent to the supervisor over.
+    """
+    # Keep the ID span of the miss cutoff equal to the single process engine
+    miss_limit = max(1, vinted.miss_limit // shard_count)
+
+    async def next_sweep(stats):
+        if stats is not None:
+            vinted.frontier.end_sweep()
+            await asyncio.to_thread(vinted.save_state)
+            stats = dict(stats, rate_limited=vinted.rate_limit_errors)
+            vinted.rate_limit_errors = 0
+            reports.put((shard_index, stats))
+
+        while head.value == 0:
+            if vinted.stopped.is_set():
+                return None
+            await asyncio.sleep(0.1)
+        if vinted.stopped.is_set():
+            return None
+
+        last_id = head.value
+        vinted.last_id = last_id
+        vinted.frontier.observe(last_id)
+
+        vinted.request_executor.new_cycle()
+        return shard_ids(vinted.frontier.begin_sweep(last_id), shard_index, shard_count)
+
+    async with AsyncProbeEngine(vinted, concurrency=vinted.probe_concurrency, miss_limit=miss_limit) as engine:
+        await engine.run(next_sweep)
+
+    # Keep the frontier of the sweep that was interrupted
+    await asyncio.to_thread(vinted.save_state)
+
+
+def run_shard(shard_index, shard_count, proxies, head, reports, sent_item_ids, checked_item_ids, stop_event, base_url, data_dir, metrics_port,
+              log_options):
+    """
+    Entry point of a worker process.
+
+    Args:
+        shard_index (int): The index of the shard this worker owns.
+        shard_count (int): The total number of shards.
+        proxies (list): The proxies assigned to this worker.
+        head (Value): The newest catalog ID, shared with the supervisor.
+        reports (Queue): The queue the sweep statistics are sent to the supervisor over.
+        sent_item_ids (IdWindow): The window of sent item IDs, shared by all workers.
+        checked_item_ids (IdWindow): The window of probed item IDs, shared by all workers.
+        stop_event (Event): Set by the supervisor to stop the worker after its in-flight probes.
+        base_url (str): The Vinted site to scan.
+        data_dir (str): The data directory of the scanner, the worker keeps its files in its own `shard-<index>` subdirectory.
+        metrics_port (int): The port of the /metrics endpoint of this worker, None to not serve metrics.
+        log_options (dict): The arguments of `configure_logging` in this worker.
+    """
+    configure_logging(**log_options)
+    install_signal_handler(directory=data_dir)
+    logging.info("Starting shard %s/%s with %s proxies", shard_index + 1, shard_count, len(proxies))
+    # Every shard persists its own frontier and writes its own analytics files, the supervisor's stay in data_dir
+    shard_dir = os.path.join(data_dir, f'shard-{shard_index}')
+    os.makedirs(shard_dir, exist_ok=True)
+    vinted = Vinted(proxies=proxies, sent_item_ids=sent_item_ids, base_url=base_url, data_dir=shard_dir,
+                    checked_item_ids=checked_item_ids)
+    if metrics_port is not None:
+        start_metrics_server(metrics_port)
+
+    def forward_stop():
+        stop_event.wait()
+        vinted.stop()
+
+    threading.Thread(target=forward_stop, name='stop-event', daemon=True).start()
+    try:
+        asyncio.run(scan_shard(vinted, shard_index, shard_count, head, reports))
+    finally:
+        # Send the queued alerts and write the buffered analytics and item store records
+        vinted.close()
+
+
+class ShardedScanner:
+    def __init__(self, processes=None, report_interval=10, proxies=None, base_url='https://www.vinted.co.uk', data_dir='.',
+                 metrics_port=9100, log_options=None, shutdown_timeout=30.0):
+        """
+        Initialize the supervisor of the sharded scanner.
+
+        Every worker process owns the IDs with `item_id % processes == shard_index` and its own slice
+        of the proxies. Because the shards are disjoint, no two workers ever probe or alert on the same
+        ID. The supervisor polls the catalog head once for all workers and publishes it over shared memory,
+        and the sent and probed item IDs live in shared windows so a restarted worker does not alert twice.
+
+        Args:
+            processes (int): The number of worker processes, defaults to the number of CPU cores.
+            report_interval (int): The number of seconds between two aggregated statistics log lines.
+            proxies (list): The proxies to split over the workers, loaded from the proxy sources when None.
+            base_url (str): The Vinted site to scan.
+            data_dir (str): The directory of the state, item store and analytics files of the supervisor, worker i
+                keeps its own in the `shard-<i>` subdirectory.
+            metrics_port (int): The port of the /metrics endpoint of the supervisor, worker i serves on
+                `metrics_port + 1 + i`. None to not serve metrics.
+            log_options (dict): The arguments of `configure_logging` in the workers, None to log at the level of
+                this process.
+            shutdown_timeout (float): The number of seconds the workers get to finish their in-flight probes and
+                flush their files when the scanner stops, before they are terminated.
+        """
+        self.processes = processes or os.cpu_count()
+        self.report_interval = report_interval
+        self.proxies = proxies
+        self.base_url = base_url
+        self.data_dir = data_dir
+        self.metrics_port = metrics_port
+        if log_options is None:
+            log_options = {'level': logging.getLogger().getEffectiveLevel()}
+        self.log_options = log_options
+        self.shutdown_timeout = shutdown_timeout
+        self.stopped = threading.Event()
+        self.context = multiprocessing.get_context('spawn')
+        self.stop_event = self.context.Event()
+        self.head = self.context.Value('q', 0, lock=False)
+        self.reports = self.context.Queue()
+        self.sent_item_ids = IdWindow.shared(context=self.context)
+        self.checked_item_ids = IdWindow.shared(context=self.context)
+        self.workers = {}
+        self.totals = {'probed': 0, 'misses': 0, 'reprobed': 0, 'sent': 0, 'rate_limited': 0}
+
+    def _start_worker(self, shard_index):
+        process = self.context.Process(
+            target=run_shard,
+            args=(shard_index, self.processes, self.proxies[shard_index::self.processes], self.head, self.reports, self.sent_item_ids,
+                  self.checked_item_ids, self.stop_event, self.base_url, self.data_dir, self.metrics_port + 1 + shard_index if self.metrics_port is not None else None,
+                  self.log_options),
+            name=f'shard-{shard_index}',
+            daemon=True
+        )
+        process.start()
+        self.workers[shard_index] = process
+
+    def _drain_reports(self):
+        while True:
+            try:
+                _, stats = self.reports.get_nowait()
+            except queue.Empty:
+                return
+
+            for key in self.totals:
+                self.totals[key] += stats.get(key, 0)
+
+    def _stop_workers(self):
+        # Let the workers finish their in-flight probes and close their sinks, terminate the ones that hang
+        self.stop_event.set()
+        deadline = time.monotonic() + self.shutdown_timeout
+        for shard_index, process in self.workers.items():
+            process.join(max(0.0, deadline - time.monotonic()))
+            if process.is_alive():
+                logging.error("Shard %s did not stop within %s seconds, terminating it", shard_index, self.shutdown_timeout)
+                process.terminate()
+                process.join()
+
+    def run(self):
+        """
+        Start the worker processes and keep publishing the catalog head to them.
+
+        The filtered catalog is watched from this process, deduplicated against the workers through
+        the shared windows of sent and probed item IDs.
+        """
+        vinted = Vinted(proxies=self.proxies, sent_item_ids=self.sent_item_ids, base_url=self.base_url, data_dir=self.data_dir,
+                        checked_item_ids=self.checked_item_ids)
+        self.proxies = list(vinted.proxy_manager.proxies)
+        if len(self.proxies) < self.processes:
+            raise ValueError(f"Not enough proxies ({len(self.proxies)}) for {self.processes} processes.")
+        if self.metrics_port is not None:
+            start_metrics_server(self.metrics_port)
+
+        try:
+            for shard_index in range(self.processes):
+                self._start_worker(shard_index)
+
+            vinted.catalog_poller.start()
+            if vinted.watch_catalog:
+                vinted.catalog_watcher.start()
+            last_report = time.time()
+            while not self.stopped.is_set():
+                head_id = vinted.catalog_poller.wait_for_head(timeout=vinted.catalog_poller.interval)
+                if head_id is not None and head_id > self.head.value:
+                    self.head.value = head_id
+
+                for shard_index, process in list(self.workers.items()):
+                    if not process.is_alive():
+                        logging.error("Shard %s exited with code %s, restarting", shard_index, process.exitcode)
+                        self._start_worker(shard_index)
+
+                self._drain_reports()
+                if time.time() - last_report >= self.report_interval:
+                    logging.info(
+                        "Shards: %s\tprobed: %s\tmisses: %s\treprobed: %s\tsent: %s\trate_limited: %s", self.processes, self.totals['probed'],
+                        self.totals['misses'], self.totals['reprobed'], self.totals['sent'], self.totals['rate_limited']
+                    )
+                    last_report = time.time()
+        finally:
+            vinted.catalog_watcher.stop()
+            vinted.catalog_poller.stop()
+            self._stop_workers()
+            self._drain_reports()
+            vinted.close()
+
+    def stop(self):
+        """
+        Stop publishing the catalog head and stop the worker processes once their in-flight probes are done.
+        """
+        self.stopped.set()
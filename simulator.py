@@ -0,0 +1,512 @@
+import argparse
+import base64
+import hashlib
+import json
+import logging
+import random
+import secrets
+import sys
+import threading
+import time
+
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+DESCRIPTION = 'Worn a handful of times, no flaws, smoke and pet free home. Bundle discounts available. '
+
+
+class TokenBucket:
+    def __init__(self, rate, burst):
+        """
+        Initialize a token bucket that allows `rate` requests per second with bursts of `burst` requests.
+
+        Args:
+            rate (float): The number of tokens added per second.
+            burst (float): The maximum number of tokens.
+        """
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    def take(self, now):
+        """
+        Take a token if one is available.
+
+        Args:
+            now (float): The current monotonic time.
+
+        Returns:
+            bool: True if the request is allowed.
+        """
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens < 1:
+            return False
+
+        self.tokens -= 1
+
+        return True
+
+
+class SimulatorServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 1024  # The async engine opens hundreds of connections at once
+
+    def handle_error(self, request, client_address):
+        # Scanners that are stopped mid-request close their connections, which is not an error
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            super().handle_error(request, client_address)
+
+
+class Simulator:
+    def __init__(self, settings, host='127.0.0.1', port=0, rate=20.0, start_id=5000000000, catalog_lag=2.0,
+                 cookie_ttl=300.0, client_rate=20.0, client_burst=20.0, gap_ratio=0.1, match_ratio=0.05,
+                 latency=0.05, slow_ratio=0.0, slow_latency=2.0, visibility_lag=0.0, description_size=3000, seed=0):
+        """
+        Initialize a local stand-in for the Vinted endpoints the scanner uses.
+
+        Item IDs are allocated at `rate` IDs per second from `start_id`, so the item details endpoint
+        returns 404 for IDs ahead of the frontier and the catalog shows the newest items `catalog_lag`
+        seconds late. Item attributes are derived from the ID, so every run with the same seed sees
+        the same items. The server also acts as a plain HTTP forward proxy: requests sent through
+        `http://<client>:<password>@host:port` are rate limited per proxy username, which lets the
+        proxy rotation and rate limiter be exercised with any number of fake proxies.
+
+        Args:
+            settings (dict): The scanner settings matching items are generated for.
+            host (str): The address to listen on.
+            port (int): The port to listen on, a free port when 0.
+            rate (float): The number of item IDs allocated per second.
+            start_id (int): The ID allocated when the simulator starts.
+            catalog_lag (float): The number of seconds before a new item shows up in the catalog.
+            cookie_ttl (float): The number of seconds a session cookie is valid for, after which the API returns 401.
+            client_rate (float): The number of API requests per second allowed per client, above which it returns 429.
+            client_burst (float): The number of API requests a client may burst.
+            gap_ratio (float): The fraction of IDs that never become visible, like deleted or draft items.
+            match_ratio (float): The fraction of items that match the settings.
+            latency (float): The number of seconds every API response is delayed by.
+            slow_ratio (float): The fraction of API responses that are delayed by `slow_latency` instead, like a congested proxy.
+            slow_latency (float): The number of seconds the slow API responses are delayed by.
+            visibility_lag (float): The maximum number of seconds an item stays 404 after its ID is allocated, so items
+                can show up out of ID order.
+            description_size (int): The approximate size in bytes of the item descriptions.
+            seed (int): The seed the item attributes are derived from.
+        """
+        self.rate = rate
+        self.start_id = start_id
+        self.catalog_lag = catalog_lag
+        self.cookie_ttl = cookie_ttl
+        self.client_rate = client_rate
+        self.client_burst = client_burst
+        self.gap_ratio = gap_ratio
+        self.match_ratio = match_ratio
+        self.latency = latency
+        self.slow_ratio = slow_ratio
+        self.slow_latency = slow_latency
+        self.visibility_lag = visibility_lag
+        self.description = (DESCRIPTION * (description_size // len(DESCRIPTION) + 1))[:description_size]
+        self.seed = seed
+
+        watchlist = settings if any(key in settings for key in ('brand_ids', 'size_ids', 'country_ids')) else \
+            (settings.get('watchlists') or [{}])[0]
+        self.brand_ids = watchlist.get('brand_ids')
+        self.size_ids = watchlist.get('size_ids')
+        self.country_ids = watchlist.get('country_ids')
+
+        self.lock = threading.Lock()
+        self.cookies = {}  # Token -> monotonic expiry
+        self.buckets = {}  # Client -> token bucket
+        self.requests = {}  # Endpoint -> status code -> count
+        self.first_seen = {}  # Item ID -> epoch the item was first served
+        self.started = time.time()
+
+        handler = type('Handler', (SimulatorHandler,), {'simulator': self})
+        self.server = SimulatorServer((host, port), handler)
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self.server.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def proxy(self, client, password='password'):
+        """
+        Get a fake proxy that sends requests through the simulator as a named client.
+
+        Args:
+            client (str): The client name, used as the proxy username.
+            password (str): The proxy password, which is not checked.
+
+        Returns:
+            dict: The proxy in the format of ProxyManager.
+        """
+        host, port = self.server.server_address[:2]
+        proxy_url = f'http://{client}:{password}@{host}:{port}'
+
+        return {'http': proxy_url, 'https': proxy_url}
+
+    def start(self):
+        """
+        Serve requests from a background thread.
+        """
+        self._thread = threading.Thread(target=self.server.serve_forever, name='simulator', daemon=True)
+        self._thread.start()
+        logging.info("Simulator listening on %s", self.url)
+
+    def stop(self):
+        """
+        Stop serving requests.
+        """
+        self.server.shutdown()
+        self.server.server_close()
+
+    def head_id(self, now=None):
+        """
+        Get the newest allocated item ID.
+
+        Args:
+            now (float): The current epoch, defaults to now.
+
+        Returns:
+            int: The newest item ID.
+        """
+        return self.start_id + int(((now if now is not None else time.time()) - self.started) * self.rate)
+
+    def created_at(self, item_id):
+        return self.started + (item_id - self.start_id) / self.rate
+
+    def visible(self, item_id, now=None):
+        """
+        Check whether an item can be seen yet.
+
+        Args:
+            item_id (int): The ID of the item.
+            now (float): The current epoch, defaults to now.
+
+        Returns:
+            bool: True if the ID is allocated and its visibility lag has passed.
+        """
+        if now is None:
+            now = time.time()
+        if item_id > self.head_id(now):
+            return False
+        if not self.visibility_lag:
+            return True
+
+        lag = random.Random(item_id * 1000003 + self.seed + 1).random() * self.visibility_lag
+        return self.created_at(item_id) + lag <= now
+
+    def _random(self, item_id):
+        return random.Random(item_id * 1000003 + self.seed)
+
+    def exists(self, item_id, rng=None):
+        return (rng or self._random(item_id)).random() >= self.gap_ratio
+
+    def matches(self, item_id):
+        rng = self._random(item_id)
+        return self.exists(item_id, rng) and rng.random() < self.match_ratio
+
+    @staticmethod
+    def _pick(rng, accepted, matching, low, high):
+        if accepted is None:
+            return rng.randint(low, high)
+        if matching:
+            return rng.choice(accepted)
+
+        while True:
+            value = rng.randint(low, high)
+            if value not in accepted:
+                return value
+
+    def item(self, item_id):
+        """
+        Generate the details of an item.
+
+        Args:
+            item_id (int): The ID of the item.
+
+        Returns:
+            dict: The item in the format of the item details API, or None if the ID is a gap.
+        """
+        rng = self._random(item_id)
+        if not self.exists(item_id, rng):
+            return None
+
+        matching = rng.random() < self.match_ratio
+        brand_id = self._pick(rng, self.brand_ids, matching, 1, 2000000)
+        size_id = self._pick(rng, self.size_ids, matching, 1, 1000)
+        country_id = self._pick(rng, self.country_ids, matching, 1, 30)
+        created = datetime.fromtimestamp(int(self.created_at(item_id)), timezone.utc)
+
+        return {
+            'id': item_id,
+            'title': f'Item {item_id}',
+            'brand_id': brand_id,
+            'brand': f'Brand {brand_id}',
+            'size_id': size_id,
+            'size': f'Size {size_id}',
+            'country_id': country_id,
+            'status': rng.choice(['New with tags', 'New without tags', 'Very good', 'Good', 'Satisfactory']),
+            'price': {'amount': f'{rng.randint(2, 200)}.0', 'currency_code': 'GBP'},
+            'updated_at_ts': created.isoformat(),
+            'description': self.description,
+            'photos': [{'full_size_url': f'https://images.example.com/{item_id}/{n}.jpeg'} for n in range(4)],
+            'user': {
+                'id': rng.randint(1, 200000000),
+                'feedback_reputation': round(rng.random(), 2),
+                'feedback_count': rng.randint(0, 500),
+                'country_code': 'UK',
+            },
+        }
+
+    def catalog(self, per_page=1, brand_ids=None, size_ids=None, country_ids=None, scan_limit=100000):
+        """
+        Generate the newest items of the catalog, as visible `catalog_lag` seconds ago.
+
+        Args:
+            per_page (int): The number of items to return.
+            brand_ids (set): Only return items of these brands, when given.
+            size_ids (set): Only return items of these sizes, when given.
+            country_ids (set): Only return items from these countries, when given.
+            scan_limit (int): The maximum number of IDs looked at.
+
+        Returns:
+            list: The items, newest first.
+        """
+        items = []
+        now = time.time() - self.catalog_lag
+        head = self.head_id(now)
+        for item_id in range(head, max(0, head - scan_limit), -1):
+            item = self.item(item_id) if self.visible(item_id, now) else None
+            if item is None:
+                continue
+            if brand_ids and item['brand_id'] not in brand_ids:
+                continue
+            if size_ids and item['size_id'] not in size_ids:
+                continue
+            if country_ids and item['country_id'] not in country_ids:
+                continue
+
+            items.append({
+                'id': item['id'],
+                'title': item['title'],
+                'brand_title': item['brand'],
+                'size_title': item['size'],
+                'price': item['price'],
+            })
+            if len(items) >= per_page:
+                break
+
+        return items
+
+    def issue_cookie(self):
+        token = secrets.token_hex(16)
+        with self.lock:
+            self.cookies[token] = time.monotonic() + self.cookie_ttl
+
+        return token
+
+    def cookie_valid(self, token):
+        with self.lock:
+            expires = self.cookies.get(token)
+
+        return expires is not None and expires > time.monotonic()
+
+    def allow(self, client):
+        now = time.monotonic()
+        with self.lock:
+            bucket = self.buckets.get(client)
+            if bucket is None:
+                bucket = self.buckets[client] = TokenBucket(self.client_rate, self.client_burst)
+
+            return bucket.take(now)
+
+    def count(self, endpoint, status):
+        with self.lock:
+            statuses = self.requests.setdefault(endpoint, {})
+            statuses[status] = statuses.get(status, 0) + 1
+
+    def served(self, item_id):
+        now = time.time()
+        with self.lock:
+            self.first_seen.setdefault(item_id, now)
+
+    def stats(self):
+        """
+        Summarise the requests served so far.
+
+        Hits are the matching items allocated after the simulator started that were served at least
+        once, and their latency is the time from allocation to the first time they were served.
+
+        Returns:
+            dict: The statistics.
+        """
+        now = time.time()
+        with self.lock:
+            requests = {endpoint: dict(statuses) for endpoint, statuses in self.requests.items()}
+            first_seen = dict(self.first_seen)
+
+        head = self.head_id(now)
+        created = [item_id for item_id in range(self.start_id, head + 1) if self.matches(item_id)]
+        latencies = sorted(first_seen[item_id] - self.created_at(item_id) for item_id in created if item_id in first_seen)
+
+        def percentile(p):
+            return round(latencies[min(len(latencies) - 1, int(p / 100 * len(latencies)))], 3) if latencies else None
+
+        return {
+            'uptime': round(now - self.started, 3),
+            'head_id': head,
+            'requests': requests,
+            'found': len(first_seen),
+            'created_matches': len(created),
+            'hits': len(latencies),
+            'latency': {f'p{p}': percentile(p) for p in (50, 90, 99)},
+        }
+
+
+class SimulatorHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    simulator = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def _client(self):
+        authorization = self.headers.get('Proxy-Authorization', '')
+        if authorization.startswith('Basic '):
+            try:
+                return base64.b64decode(authorization[6:]).decode().split(':', 1)[0]
+            except ValueError:
+                pass
+
+        return self.client_address[0]
+
+    def _cookie(self):
+        for part in self.headers.get('Cookie', '').split(';'):
+            name, _, value = part.strip().partition('=')
+            if name == 'access_token_web':
+                return value
+
+        return None
+
+    def _send(self, status, body=b'', content_type='application/json', headers=None):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_json(self, status, data, endpoint):
+        self.simulator.count(endpoint, status)
+        self._send(status, json.dumps(data, separators=(',', ':')).encode())
+
+    def _api_allowed(self, endpoint):
+        simulator = self.simulator
+        latency = simulator.slow_latency if simulator.slow_ratio and random.random() < simulator.slow_ratio else simulator.latency
+        if latency:
+            time.sleep(latency)
+
+        if not simulator.allow(self._client()):
+            self._send_json(429, {'code': 106, 'message': 'Too many requests'}, endpoint)
+            return False
+
+        if not simulator.cookie_valid(self._cookie()):
+            self._send_json(401, {'code': 100, 'message': 'Invalid authentication token'}, endpoint)
+            return False
+
+        return True
+
+    def do_GET(self):
+        simulator = self.simulator
+        url = urlsplit(self.path)
+        path = url.path.rstrip('/') or '/'
+
+        if path == '/':
+            token = simulator.issue_cookie()
+            simulator.count('cookie', 200)
+            self._send(200, b'<html></html>', 'text/html', {'Set-Cookie': f'access_token_web={token}; Path=/; HttpOnly'})
+        elif path == '/robots.txt':
+            self._send(200, b'User-agent: *\n', 'text/plain')
+        elif path == '/__stats':
+            self._send(200, json.dumps(simulator.stats()).encode())
+        elif path == '/api/v2/catalog/items':
+            if not self._api_allowed('catalog'):
+                return
+
+            query = parse_qs(url.query)
+            items = simulator.catalog(
+                per_page=min(int(query.get('per_page', ['1'])[0]), 960),
+                brand_ids={int(value) for value in query.get('brand_ids[]', [])},
+                size_ids={int(value) for value in query.get('size_ids[]', [])},
+                country_ids={int(value) for value in query.get('country_ids[]', [])},
+            )
+            body = json.dumps({'items': items, 'code': 0}, separators=(',', ':')).encode()
+            etag = f'"{hashlib.sha1(body).hexdigest()}"'
+            if self.headers.get('If-None-Match') == etag:
+                simulator.count('catalog', 304)
+                self._send(304, headers={'ETag': etag})
+                return
+
+            simulator.count('catalog', 200)
+            self._send(200, body, headers={'ETag': etag})
+        elif path.startswith('/api/v2/items/'):
+            if not self._api_allowed('item'):
+                return
+
+            try:
+                item_id = int(path.rsplit('/', 1)[1])
+            except ValueError:
+                self._send_json(404, {'code': 404, 'message': 'Not found'}, 'item')
+                return
+
+            item = simulator.item(item_id) if simulator.visible(item_id) else None
+            if item is None:
+                self._send_json(404, {'code': 404, 'message': 'Not found'}, 'item')
+                return
+
+            simulator.served(item_id)
+            self._send_json(200, {'item': item, 'code': 0}, 'item')
+        else:
+            self._send(404, b'{}')
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO, format='[%(asctime)s] - %(message)s', datefmt='%d-%m-%y %H:%M:%S')
+
+    parser = argparse.ArgumentParser(description='Serve a local stand-in for the Vinted API.')
+    parser.add_argument('--host', default='127.0.0.1', help='The address to listen on.')
+    parser.add_argument('--port', type=int, default=8000, help='The port to listen on.')
+    parser.add_argument('--settings', default='config/settings.json', help='The settings matching items are generated for.')
+    parser.add_argument('--rate', type=float, default=20.0, help='The number of item IDs allocated per second.')
+    parser.add_argument('--catalog-lag', type=float, default=2.0, help='The seconds before a new item shows up in the catalog.')
+    parser.add_argument('--cookie-ttl', type=float, default=300.0, help='The seconds a session cookie is valid for.')
+    parser.add_argument('--client-rate', type=float, default=20.0, help='The API requests per second allowed per client.')
+    parser.add_argument('--client-burst', type=float, default=20.0, help='The API requests a client may burst.')
+    parser.add_argument('--gap-ratio', type=float, default=0.1, help='The fraction of IDs that never become visible.')
+    parser.add_argument('--match-ratio', type=float, default=0.05, help='The fraction of items that match the settings.')
+    parser.add_argument('--latency', type=float, default=0.05, help='The seconds every API response is delayed by.')
+    parser.add_argument('--slow-ratio', type=float, default=0.0, help='The fraction of API responses that are slow.')
+    parser.add_argument('--slow-latency', type=float, default=2.0, help='The seconds the slow API responses are delayed by.')
+    parser.add_argument('--visibility-lag', type=float, default=0.0, help='The maximum seconds a new item stays 404.')
+    parser.add_argument('--seed', type=int, default=0, help='The seed the item attributes are derived from.')
+    args = parser.parse_args()
+
+    with open(args.settings, 'r') as file:
+        settings = json.load(file)
+
+    simulator = Simulator(
+        settings, host=args.host, port=args.port, rate=args.rate, catalog_lag=args.catalog_lag, cookie_ttl=args.cookie_ttl,
+        client_rate=args.client_rate, client_burst=args.client_burst, gap_ratio=args.gap_ratio,
+        match_ratio=args.match_ratio, latency=args.latency, slow_ratio=args.slow_ratio, slow_latency=args.slow_latency,
+        visibility_lag=args.visibility_lag, seed=args.seed
+    )
+    simulator.start()
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        simulator.stop()
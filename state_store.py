@@ -0,0 +1,153 @@
+import csv
+import json
+import logging
+import sqlite3
+import threading
+import time
+
+from analytics_sink import rotated_paths
+
+
+class StateStore:
+    def __init__(self, path='state.db', recent_sent=100000, checkpoint_interval=5.0):
+        """
+        Initialize the on-disk scanner state, stored in SQLite in WAL mode.
+
+        The store holds the frontier, the learned offset statistics and the most recently sent item
+        IDs, so a restarted scanner resumes at full speed without re-alerting items.
+
+        Args:
+            path (str): The path of the SQLite database.
+            recent_sent (int): The number of most recently sent item IDs that are kept.
+            checkpoint_interval (float): The minimum number of seconds between two frontier checkpoints.
+        """
+        self.path = path
+        self.recent_sent = recent_sent
+        self.checkpoint_interval = checkpoint_interval
+        self.last_checkpoint = 0.0
+        self.lock = threading.Lock()
+
+        self.connection = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute('PRAGMA synchronous=NORMAL')
+        self.connection.execute('CREATE TABLE IF NOT EXISTS state (key TEXT PRIMARY KEY, value TEXT NOT NULL)')
+        self.connection.execute('CREATE TABLE IF NOT EXISTS sent_items (item_id INTEGER PRIMARY KEY, sent_at REAL NOT NULL)')
+
+    def load(self):
+        """
+        Load the stored state.
+
+        Returns:
+            dict: The stored state values, with the recently sent item IDs under 'sent_item_ids'.
+        """
+        with self.lock:
+            state = {key: json.loads(value) for key, value in self.connection.execute('SELECT key, value FROM state')}
+            state['sent_item_ids'] = [row[0] for row in self.connection.execute('SELECT item_id FROM sent_items ORDER BY item_id')]
+
+        return state
+
+    def save(self, **values):
+        """
+        Store state values.
+
+        Args:
+            **values: The values to store, by key. Values must be JSON serializable.
+        """
+        with self.lock:
+            self.connection.execute('BEGIN')
+            self.connection.executemany(
+                'INSERT OR REPLACE INTO state (key, value) VALUES (?, ?)',
+                [(key, json.dumps(value)) for key, value in values.items()]
+            )
+            self.connection.execute('COMMIT')
+
+    def checkpoint(self, **values):
+        """
+        Store state values, at most once per checkpoint interval.
+
+        Args:
+            **values: The values to store, by key. Values must be JSON serializable.
+
+        Returns:
+            bool: True if the values were stored.
+        """
+        now = time.monotonic()
+        if now - self.last_checkpoint < self.checkpoint_interval:
+            return False
+
+        self.last_checkpoint = now
+        self.save(**values)
+
+        return True
+
+    def record_sent(self, item_id):
+        """
+        Record that an item was sent.
+
+        Args:
+            item_id (int): The ID of the sent item.
+        """
+        with self.lock:
+            self.connection.execute('INSERT OR REPLACE INTO sent_items (item_id, sent_at) VALUES (?, ?)', (int(item_id), time.time()))
+
+    def prune(self):
+        """
+        Drop all but the most recently sent item IDs.
+        """
+        with self.lock:
+            self.connection.execute(
+                'DELETE FROM sent_items WHERE item_id < (SELECT MIN(item_id) FROM '
+                '(SELECT item_id FROM sent_items ORDER BY item_id DESC LIMIT ?))',
+                (self.recent_sent,)
+            )
+
+    def import_csv(self, csv_file_path='sent_items.csv'):
+        """
+        Seed an empty store from the sent items CSV file and the files it was rotated to.
+
+        Args:
+            csv_file_path (str): The path of the sent items CSV file.
+
+        Returns:
+            int: The number of imported sent item IDs.
+        """
+        paths = rotated_paths(csv_file_path)
+        if not paths:
+            return 0
+
+        item_ids = []
+        last_row = None
+        for path in paths:
+            with open(path, newline='', encoding='utf-8') as fh:
+                for row in csv.DictReader(fh):
+                    try:
+                        item_ids.append(int(row['Item ID']))
+                    except (KeyError, TypeError, ValueError):
+                        continue
+                    last_row = row
+
+        item_ids = item_ids[-self.recent_sent:]
+        with self.lock:
+            self.connection.execute('BEGIN')
+            self.connection.executemany(
+                'INSERT OR IGNORE INTO sent_items (item_id, sent_at) VALUES (?, ?)',
+                [(item_id, 0.0) for item_id in item_ids]
+            )
+            self.connection.execute('COMMIT')
+
+        if last_row is not None:
+            try:
+                self.save(lowest_offset=int(last_row['Lowest Offset']), highest_offset=int(last_row['Highest Offset']))
+            except (KeyError, TypeError, ValueError):
+                pass
+
+        logging.info("Imported %s sent item IDs from %s", len(item_ids), csv_file_path)
+
+        return len(item_ids)
+
+    def close(self):
+        """
+        Close the database connection.
+        """
+        with self.lock:
+            self.connection.close()
@@ -0,0 +1,133 @@
+import http.server
+import json
+import threading
+import time
+import unittest
+
+from alert_dispatcher import AlertDispatcher
+from session_pool import SessionPool
+
+
+class StubWebhook(http.server.ThreadingHTTPServer):
+    def __init__(self):
+        """
+        Initialize a local stand-in for a Discord webhook that records every message it receives.
+
+        Responses are taken from `responses` in order, (status code, headers, delay) tuples, and
+        are a plain 204 once it is empty.
+        """
+        super().__init__(('127.0.0.1', 0), StubWebhookHandler)
+        self.lock = threading.Lock()
+        self.responses = []
+        self.messages = []  # (monotonic time, embeds)
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+
+    @property
+    def url(self):
+        return f'http://127.0.0.1:{self.server_port}/webhook'
+
+    def embeds(self):
+        with self.lock:
+            return [embed for _, embeds in self.messages for embed in embeds]
+
+    def close(self):
+        self.shutdown()
+        self.server_close()
+
+
+class StubWebhookHandler(http.server.BaseHTTPRequestHandler):
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+        with self.server.lock:
+            self.server.messages.append((time.monotonic(), body['embeds']))
+            status_code, headers, delay = self.server.responses.pop(0) if self.server.responses else (204, {}, 0)
+
+        time.sleep(delay)
+        self.send_response(status_code)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def log_message(self, format, *args):
+        pass
+
+
+def embed(n, description=''):
+    return {'title': f'Item {n}', 'description': description, 'fields': []}
+
+
+class AlertDispatcherTest(unittest.TestCase):
+    def setUp(self):
+        self.webhook = StubWebhook()
+        self.session_pool = SessionPool()
+
+    def tearDown(self):
+        self.webhook.close()
+        self.session_pool.close()
+
+    def dispatch(self, embeds, **kwargs):
+        dispatcher = AlertDispatcher(self.session_pool, base_delay=0.05, **kwargs)
+        for item in embeds:
+            self.assertTrue(dispatcher.submit([self.webhook.url], item))
+        dispatcher.start()
+        dispatcher.stop(timeout=10)
+
+        return dispatcher
+
+    def test_batches_embeds_per_message(self):
+        self.dispatch([embed(n) for n in range(25)])
+
+        self.assertEqual([len(embeds) for _, embeds in self.webhook.messages], [10, 10, 5])
+        self.assertEqual([item['title'] for item in self.webhook.embeds()], [f'Item {n}' for n in range(25)])
+
+    def test_batches_respect_the_character_limit(self):
+        self.dispatch([embed(n, 'x' * 2500) for n in range(5)])
+
+        self.assertEqual([len(embeds) for _, embeds in self.webhook.messages], [2, 2, 1])
+
+    def test_waits_for_retry_after(self):
+        self.webhook.responses = [(429, {'Retry-After': '0.5'}, 0)]
+        dispatcher = self.dispatch([embed(1)])
+
+        (first, _), (second, _) = self.webhook.messages
+        self.assertGreaterEqual(second - first, 0.5)
+        self.assertEqual(len(self.webhook.embeds()), 2)
+        self.assertEqual(dispatcher.dropped, 0)
+
+    def test_waits_for_the_rate_limit_reset(self):
+        self.webhook.responses = [(204, {'X-RateLimit-Remaining': '0', 'X-RateLimit-Reset-After': '0.5'}, 0)]
+        self.dispatch([embed(n) for n in range(11)])
+
+        (first, _), (second, _) = self.webhook.messages
+        self.assertGreaterEqual(second - first, 0.5)
+        self.assertEqual(len(self.webhook.embeds()), 11)
+
+    def test_drops_a_message_after_its_attempts(self):
+        self.webhook.responses = [(500, {}, 0)] * 2
+        dispatcher = self.dispatch([embed(1)], max_attempts=2)
+
+        self.assertEqual(len(self.webhook.messages), 2)
+        self.assertEqual(dispatcher.dropped, 1)
+
+    def test_times_out_a_hanging_webhook(self):
+        self.webhook.responses = [(204, {}, 2.0)]
+        started = time.monotonic()
+        dispatcher = self.dispatch([embed(1)], max_attempts=1, timeout=0.3)
+
+        self.assertLess(time.monotonic() - started, 1.5)
+        self.assertEqual(dispatcher.dropped, 1)
+
+    def test_submit_is_all_or_nothing(self):
+        dispatcher = AlertDispatcher(self.session_pool, max_queue=1)
+        webhook_urls = [self.webhook.url, self.webhook.url + '/other']
+
+        self.assertTrue(dispatcher.submit(webhook_urls, embed(1)))
+        self.assertFalse(dispatcher.submit(webhook_urls, embed(2)))
+        self.assertEqual(dispatcher.queue.qsize(), 1)
+        self.assertEqual(dispatcher.dropped, 2)
+
+
+if __name__ == '__main__':
+    unittest.main()